@@ -0,0 +1,150 @@
+"""
+Measure the hot catalog lookups before and after the index migrations.
+
+Builds a synthetic catalog without the lookup and uniqueness indexes, times
+each lookup, applies the migrations and times them again.
+
+Usage:
+    python benchmarks/lookup_latency.py [songs]
+
+SQLALCHEMY_DATABASE_URL may point at an empty scratch database, a temporary
+SQLite file is used otherwise.
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/lookup_latency.db")
+os.environ.setdefault("ELASTICSEARCH_URL", "http://localhost:9200")
+os.environ.setdefault("ELASTICSEARCH_USER", "")
+os.environ.setdefault("ELASTICSEARCH_PASSWORD", "")
+
+from sqlalchemy import insert, select
+
+from musicapp import database, migrations, models
+
+SONGS = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+USERS = SONGS // 4
+ARTISTS = SONGS // 20
+ALBUMS = SONGS // 10
+GENRES = 50
+PLAYLISTS = USERS
+ENTRIES = SONGS * 2
+RATINGS = SONGS * 2
+
+# Lookups timed per query
+SAMPLES = 200
+
+BATCH = 10_000
+
+
+def load(connection, model, rows):
+    for start in range(0, len(rows), BATCH):
+        connection.execute(insert(model), rows[start:start + BATCH])
+
+
+def seed(engine):
+    rng = random.Random(17)
+    pairs = lambda count, left, right: list({(rng.randint(1, left), rng.randint(1, right)) for _ in range(count)})
+
+    with engine.begin() as connection:
+        load(connection, models.Users, [{"id": n, "username": f"user{n}", "role": 2, "passwordHash": ""} for n in range(1, USERS + 1)])
+        load(connection, models.Genre, [{"id": n, "genreName": f"genre{n}"} for n in range(1, GENRES + 1)])
+        load(connection, models.Artist, [{"id": n, "artistName": f"artist{n}"} for n in range(1, ARTISTS + 1)])
+        load(connection, models.Album, [
+            {"id": n, "albumName": f"album{n}", "artistId": n % ARTISTS + 1} for n in range(1, ALBUMS + 1)
+        ])
+        load(connection, models.Songs, [
+            {"id": n, "songName": f"song{n}", "artistId": n % ARTISTS + 1, "genreId": n % GENRES + 1, "albumId": n % ALBUMS + 1}
+            for n in range(1, SONGS + 1)
+        ])
+        load(connection, models.Playlist, [
+            {"id": n, "playlistName": f"playlist{n}", "userId": n} for n in range(1, PLAYLISTS + 1)
+        ])
+        load(connection, models.PlaylistSong, [
+            {"playlistId": playlist, "songId": song} for playlist, song in pairs(ENTRIES, PLAYLISTS, SONGS)
+        ])
+        load(connection, models.Rating, [
+            {"byUserId": user, "songId": song, "rating": 3.0} for user, song in pairs(RATINGS, USERS, SONGS)
+        ])
+
+
+def drop_indexes(engine):
+    # Start from the schema the application had before the migrations
+    with engine.begin() as connection:
+        for table in models.Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if not index.name.endswith("_id") and index.table.name != "songWaveform":
+                    index.drop(connection, checkfirst=True)
+
+
+def lookups():
+    rng = random.Random(42)
+    return {
+        "song by name": lambda: select(models.Songs.id).where(models.Songs.songName == f"song{rng.randint(1, SONGS)}"),
+        "artist by name": lambda: select(models.Artist.id).where(models.Artist.artistName == f"artist{rng.randint(1, ARTISTS)}"),
+        "genre by name": lambda: select(models.Genre.id).where(models.Genre.genreName == f"genre{rng.randint(1, GENRES)}"),
+        "album by name": lambda: select(models.Album.id).where(models.Album.albumName == f"album{rng.randint(1, ALBUMS)}"),
+        "user by username": lambda: select(models.Users.id).where(models.Users.username == f"user{rng.randint(1, USERS)}"),
+        "playlist by name": lambda: select(models.Playlist.id).where(
+            models.Playlist.playlistName == f"playlist{rng.randint(1, PLAYLISTS)}"
+        ),
+        "playlists of user": lambda: select(models.Playlist.id).where(models.Playlist.userId == rng.randint(1, USERS)),
+        "rating of user": lambda: select(models.Rating.id).where(
+            models.Rating.byUserId == rng.randint(1, USERS), models.Rating.songId == rng.randint(1, SONGS)
+        ),
+        "song in playlist": lambda: select(models.PlaylistSong.id).where(
+            models.PlaylistSong.playlistId == rng.randint(1, PLAYLISTS),
+            models.PlaylistSong.songId == rng.randint(1, SONGS)
+        )
+    }
+
+
+def measure(engine) -> dict:
+    results = {}
+    with engine.connect() as connection:
+        for name, query in lookups().items():
+            timings = []
+            for _ in range(SAMPLES):
+                statement = query()
+                started = time.perf_counter()
+                connection.execute(statement).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (statistics.median(timings), sorted(timings)[int(SAMPLES * 0.95)])
+    return results
+
+
+def main():
+    engine = database.engine
+    models.Base.metadata.create_all(engine)
+    drop_indexes(engine)
+
+    started = time.perf_counter()
+    seed(engine)
+    print(f"Seeded {SONGS} songs, {RATINGS} ratings and {ENTRIES} playlist entries in {time.perf_counter() - started:.1f}s")
+
+    before = measure(engine)
+
+    started = time.perf_counter()
+    applied = migrations.upgrade(engine)
+    print(f"Applied migrations {applied} in {time.perf_counter() - started:.1f}s\n")
+
+    after = measure(engine)
+
+    print(f"{'lookup':<20}{'before p50':>12}{'before p95':>12}{'after p50':>12}{'after p95':>12}{'speedup':>10}")
+    for name in before:
+        speedup = before[name][0] / after[name][0] if after[name][0] else float("inf")
+        print(
+            f"{name:<20}{before[name][0]:>10.3f}ms{before[name][1]:>10.3f}ms"
+            f"{after[name][0]:>10.3f}ms{after[name][1]:>10.3f}ms{speedup:>9.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from sqlalchemy import delete, update
+
+from . import audio, cache, loaders, models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Number of processes analysing uploaded audio files
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", 2))
+
+# Analysis runs in separate processes, saving the results only needs a thread
+pool = None
+writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analysis")
+
+
+def get_pool() -> ProcessPoolExecutor:
+
+    """
+    Get the process pool, starting it on first use.
+    """
+
+    global pool
+    if pool is None:
+        pool = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS)
+    return pool
+
+
+def schedule(song_id: int, path: str):
+
+    """
+    Extract the audio metadata and waveform peaks of a stored song in the background.
+
+    The request that stored the song returns right away; the duration,
+    sample rate, bitrate and channels are saved on the song and the peaks
+    in its waveform levels once computed.
+
+    Parameters:
+        song_id (int): The ID of the song.
+        path (str): The location of the audio file.
+    """
+
+    future = get_pool().submit(audio.analyse, path)
+    future.add_done_callback(lambda done: writer.submit(save_analysis, song_id, done))
+
+
+def save_analysis(song_id: int, done):
+
+    """
+    Persist the result of a finished analysis on the song.
+    """
+
+    # Analyses cancelled at shutdown leave the song as it is
+    if done.cancelled():
+        return
+
+    if done.exception() is not None:
+        logger.error("Analysis of song %s failed", song_id, exc_info=done.exception())
+        return
+
+    metadata, waveform = done.result()["metadata"], done.result()["waveform"]
+
+    db = SessionLocal()
+    try:
+        if metadata:
+            db.execute(update(models.Songs).where(models.Songs.id == song_id).values(**metadata))
+            db.execute(loaders.touch_playlists(models.Songs.id == song_id))
+
+        # Replace any earlier peaks of the song
+        if waveform:
+            db.execute(delete(models.SongWaveform).where(models.SongWaveform.songId == song_id))
+            db.add_all(
+                models.SongWaveform(songId=song_id, level=level, **peaks)
+                for level, peaks in enumerate(waveform)
+            )
+
+        db.commit()
+    finally:
+        db.close()
+
+    # The song's responses show its audio details
+    if metadata:
+        cache.catalog.invalidate_threadsafe(cache.SONGS, cache.ALBUMS, cache.ARTISTS)
+
+
+def shutdown():
+
+    """
+    Stop the worker pools, used at application shutdown.
+    """
+
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+    writer.shutdown()
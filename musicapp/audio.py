@@ -0,0 +1,360 @@
+import os
+import struct
+
+import numpy as np
+
+# Bitrates in kbps indexed by [MPEG-1?][layer][bitrate index]
+MP3_BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+    }
+}
+
+# Sample rates indexed by the MPEG version bits
+MP3_SAMPLE_RATES = {
+    0b11: [44100, 48000, 32000],
+    0b10: [22050, 24000, 16000],
+    0b00: [11025, 12000, 8000]
+}
+
+# Bytes read from the start of a file to find its headers
+HEADER_BYTES = 128 * 1024
+
+# Samples summarised by one min/max peak at each waveform zoom level
+WAVEFORM_LEVELS = [
+    int(level) for level in os.environ.get("WAVEFORM_LEVELS", "1024,4096,16384").split(",")
+]
+
+# Frames decoded at a time while computing peaks
+WAVEFORM_BLOCK_FRAMES = 1024 * 1024
+
+
+def analyse(path: str) -> dict:
+
+    """
+    Extract the metadata and the waveform peaks of an audio file, meant to run in a worker process.
+
+    Parameters:
+        path (str): The path of the audio file.
+
+    Returns:
+        dict: The `metadata` of the file and its `waveform` levels, either may be None.
+    """
+
+    return {
+        "metadata": extract_metadata(path),
+        "waveform": waveform_peaks(path)
+    }
+
+
+def extract_metadata(path: str) -> dict | None:
+
+    """
+    Read the duration, sample rate, bitrate and channels of a WAV, MP3 or FLAC file.
+
+    Only the headers are parsed, the audio itself is never decoded.
+
+    Parameters:
+        path (str): The path of the audio file.
+
+    Returns:
+        dict | None: The `duration`, `sampleRate`, `bitrate` and `channels` of the file,
+                     or None when the format isn't recognised.
+    """
+
+    size = os.path.getsize(path)
+    with open(path, "rb") as handle:
+        head = handle.read(HEADER_BYTES)
+
+        if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+            return parse_wav(handle, size)
+
+    # FLAC and MP3 files may start with an ID3v2 tag
+    offset = skip_id3(head)
+
+    if head[offset:offset + 4] == b"fLaC":
+        return parse_flac(head, offset, size)
+
+    return parse_mp3(head, offset, size)
+
+
+def skip_id3(head: bytes) -> int:
+
+    # The ID3v2 size is stored as four 7-bit bytes after the 10-byte header
+    if head[:3] != b"ID3" or len(head) < 10:
+        return 0
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def parse_wav(handle, size: int) -> dict | None:
+
+    """
+    Parse the fmt and data chunks of a RIFF/WAVE file.
+    """
+
+    handle.seek(12)
+    fmt = None
+
+    while True:
+        header = handle.read(8)
+        if len(header) < 8:
+            return None
+
+        chunk_id, chunk_size = struct.unpack("<4sI", header)
+
+        if chunk_id == b"fmt ":
+            fmt = handle.read(chunk_size)
+            if chunk_size % 2:
+                handle.seek(1, os.SEEK_CUR)
+            continue
+
+        if chunk_id == b"data" and fmt:
+            _, channels, sample_rate, byte_rate = struct.unpack("<HHII", fmt[:12])
+            if not byte_rate:
+                return None
+
+            # Streams written on the fly may leave the data size unset
+            data_size = min(chunk_size, size - handle.tell())
+            return {
+                "duration": round(data_size / byte_rate, 3),
+                "sampleRate": sample_rate,
+                "bitrate": byte_rate * 8,
+                "channels": channels
+            }
+
+        # Chunks are padded to an even size
+        handle.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+def parse_flac(head: bytes, offset: int, size: int) -> dict | None:
+
+    """
+    Parse the STREAMINFO block of a FLAC file.
+    """
+
+    # STREAMINFO is always the first metadata block
+    block = head[offset + 8:offset + 8 + 34]
+    if len(block) < 18 or head[offset + 4] & 0x7F != 0:
+        return None
+
+    packed = int.from_bytes(block[10:18], "big")
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    total_samples = packed & 0xFFFFFFFFF
+
+    if not sample_rate or not total_samples:
+        return None
+
+    duration = total_samples / sample_rate
+    return {
+        "duration": round(duration, 3),
+        "sampleRate": sample_rate,
+        "bitrate": int((size - offset) * 8 / duration),
+        "channels": channels
+    }
+
+
+def parse_mp3(head: bytes, offset: int, size: int) -> dict | None:
+
+    """
+    Parse the first MPEG audio frame header, using a Xing/Info frame count when present.
+    """
+
+    position = head.find(b"\xff", offset)
+    while 0 <= position < len(head) - 4:
+        b1, b2, b3 = head[position + 1], head[position + 2], head[position + 3]
+
+        version = (b1 >> 3) & 0x3
+        layer = 4 - ((b1 >> 1) & 0x3)
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 0x3
+
+        # A valid frame sync has 11 set bits and no reserved values
+        if (b1 & 0xE0) == 0xE0 and version != 0b01 and layer != 4 and 0 < bitrate_index < 15 and rate_index != 3:
+            mpeg1 = version == 0b11
+            sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+            bitrate = MP3_BITRATES[mpeg1][layer][bitrate_index] * 1000
+            channels = 1 if b3 >> 6 == 0b11 else 2
+            samples_per_frame = 384 if layer == 1 else 1152 if mpeg1 or layer == 2 else 576
+
+            # VBR files carry their frame count in a Xing or Info header
+            side_info = (32 if channels == 2 else 17) if mpeg1 else (17 if channels == 2 else 9)
+            xing = position + 4 + side_info
+            frames = None
+            if head[xing:xing + 4] in (b"Xing", b"Info"):
+                flags = struct.unpack(">I", head[xing + 4:xing + 8])[0]
+                if flags & 0x1:
+                    frames = struct.unpack(">I", head[xing + 8:xing + 12])[0]
+
+            audio_bytes = size - position
+            if frames:
+                duration = frames * samples_per_frame / sample_rate
+                bitrate = int(audio_bytes * 8 / duration) if duration else bitrate
+            else:
+                duration = audio_bytes * 8 / bitrate
+
+            return {
+                "duration": round(duration, 3),
+                "sampleRate": sample_rate,
+                "bitrate": bitrate,
+                "channels": channels
+            }
+
+        position = head.find(b"\xff", position + 1)
+
+    return None
+
+
+def read_wav_format(path: str) -> tuple[dict, int, int] | None:
+
+    """
+    Locate the PCM samples of a WAV file.
+
+    Returns:
+        tuple[dict, int, int] | None: The fmt fields, the offset and the size of the data chunk.
+    """
+
+    with open(path, "rb") as handle:
+        if handle.read(12)[8:12] != b"WAVE":
+            return None
+
+        fmt = None
+        while True:
+            header = handle.read(8)
+            if len(header) < 8:
+                return None
+
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = handle.read(chunk_size)
+                if chunk_size % 2:
+                    handle.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data" and fmt:
+                offset = handle.tell()
+                size = min(chunk_size, os.path.getsize(path) - offset)
+                break
+            else:
+                handle.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+    audio_format, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+
+    # WAVE_FORMAT_EXTENSIBLE keeps the real format at the start of the sub-format GUID
+    if audio_format == 0xFFFE and len(fmt) >= 26:
+        audio_format = struct.unpack("<H", fmt[24:26])[0]
+
+    info = {
+        "format": audio_format,
+        "channels": channels,
+        "sampleRate": sample_rate,
+        "blockAlign": block_align,
+        "bits": bits
+    }
+    return info, offset, size
+
+
+def decode_block(raw: np.ndarray, info: dict) -> np.ndarray | None:
+
+    """
+    Convert raw little-endian PCM frames into floats in [-1, 1], one column per channel.
+    """
+
+    channels, bits = info["channels"], info["bits"]
+
+    if info["format"] == 3 and bits == 32:
+        samples = raw.view("<f4")
+    elif info["format"] != 1:
+        return None
+    elif bits == 8:
+        samples = (raw.astype(np.float32) - 128) / 128
+    elif bits == 16:
+        samples = raw.view("<i2").astype(np.float32) / 32768
+    elif bits == 24:
+        # Widen every 3-byte sample to 4 bytes, then shift the sign into place
+        triples = raw.reshape(-1, 3)
+        widened = np.zeros((len(triples), 4), dtype=np.uint8)
+        widened[:, 1:] = triples
+        samples = widened.view("<i4").ravel().astype(np.float32) / 2147483648
+    elif bits == 32:
+        samples = raw.view("<i4").astype(np.float32) / 2147483648
+    else:
+        return None
+
+    return np.clip(samples.reshape(-1, channels), -1, 1)
+
+
+def waveform_peaks(path: str, levels: list[int] = WAVEFORM_LEVELS) -> list[dict] | None:
+
+    """
+    Summarise the PCM samples of a WAV file as min/max peaks at a few zoom levels.
+
+    The file is decoded once, block by block, into the finest level; the
+    coarser levels are reduced from it. Each level is stored as int8 pairs
+    (min, max) scaled to [-127, 127].
+
+    Parameters:
+        path (str): The path of the audio file.
+        levels (list[int]): The samples summarised by one peak, finest first,
+                            each a multiple of the previous one.
+
+    Returns:
+        list[dict] | None: The `samplesPerPeak`, `sampleRate` and `peaks` bytes of every level,
+                           or None when the file isn't PCM WAV.
+    """
+
+    located = read_wav_format(path)
+    if not located:
+        return None
+
+    info, offset, size = located
+    finest = levels[0]
+    frames = size // info["blockAlign"]
+    if not frames or info["blockAlign"] != info["channels"] * info["bits"] // 8:
+        return None
+
+    raw = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(frames * info["blockAlign"],))
+    block_frames = max(WAVEFORM_BLOCK_FRAMES // finest, 1) * finest
+    mins, maxs = [], []
+
+    # Decode bounded blocks that line up with the finest peaks
+    for start in range(0, frames, block_frames):
+        end = min(start + block_frames, frames)
+        samples = decode_block(np.asarray(raw[start * info["blockAlign"]:end * info["blockAlign"]]), info)
+        if samples is None:
+            return None
+
+        # Mix the channels down to one envelope, then reduce every bucket of frames
+        buckets = np.arange(0, len(samples), finest)
+        mins.append(np.minimum.reduceat(samples.min(axis=1), buckets))
+        maxs.append(np.maximum.reduceat(samples.max(axis=1), buckets))
+
+    low, high = np.concatenate(mins), np.concatenate(maxs)
+    result = []
+
+    for samples_per_peak in levels:
+        # Coarser levels merge groups of finer peaks
+        factor = samples_per_peak // finest
+        buckets = np.arange(0, len(low), factor)
+        level_low = np.minimum.reduceat(low, buckets)
+        level_high = np.maximum.reduceat(high, buckets)
+
+        peaks = np.empty((len(buckets), 2), dtype=np.int8)
+        peaks[:, 0] = np.round(level_low * 127)
+        peaks[:, 1] = np.round(level_high * 127)
+
+        result.append({
+            "samplesPerPeak": samples_per_peak,
+            "sampleRate": info["sampleRate"],
+            "peaks": peaks.tobytes()
+        })
+
+    return result
+
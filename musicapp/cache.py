@@ -0,0 +1,375 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable
+
+from fastapi import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import database
+
+# Where cached catalog responses live: "memory://" keeps them in each worker,
+# "redis://host:6379/0" shares them, and their invalidations, across workers
+CACHE_URL = os.environ.get("CACHE_URL", "memory://")
+
+# Seconds a cached response is served before it is read again from the database
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", 300))
+
+# Seconds after an invalidation during which misses load from the primary, so
+# that a read replica still behind the write can't refill the cache with old rows
+CACHE_PRIMARY_SECONDS = int(os.environ.get("CACHE_PRIMARY_SECONDS", 5))
+
+# Responses kept by the in-process cache before the least recently used are evicted
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 10_000))
+
+# The cached catalog reads, each invalidated as a whole by the writes that change it
+SONGS = "song"
+ALBUMS = "album"
+ARTISTS = "artist"
+GENRES = "genre"
+CATALOG = (SONGS, ALBUMS, ARTISTS, GENRES)
+
+
+def seed_version() -> int:
+
+    """
+    Get the first version of a counter the backend doesn't hold, from the clock,
+    so that a restarted worker or an evicted counter never reuses an old version.
+    """
+
+    return time.time_ns() // 1_000_000
+
+
+def etag(*parts) -> str:
+
+    """
+    Build a weak entity tag from the parts identifying a representation.
+    """
+
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def body_etag(body: bytes, *parts) -> str:
+
+    """
+    Build a weak entity tag from a digest of a response body, so that it changes
+    with the body whichever worker serves it.
+    """
+
+    return etag(*parts, hashlib.blake2b(body, digest_size=8).hexdigest())
+
+
+def etag_matches(if_none_match: str | None, tag: str) -> bool:
+
+    """
+    Check an If-None-Match header against an entity tag, with the weak comparison of RFC 9110.
+    """
+
+    if not if_none_match:
+        return False
+
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or tag.removeprefix("W/") in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+def not_modified(tag: str) -> Response:
+
+    """
+    Answer a conditional GET whose representation hasn't changed.
+    """
+
+    return Response(status_code=304, headers={"ETag": tag})
+
+
+class MemoryBackend:
+
+    """
+    An in-process LRU cache with per-entry expiry. Version counters are never evicted.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self.counters: dict[str, int] = {}
+        self.evictions = 0
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def counter(self, key: str) -> int:
+        return self.counters.setdefault(key, seed_version())
+
+    async def incr(self, key: str) -> int:
+        self.counters[key] = await self.counter(key) + 1
+        return self.counters[key]
+
+    async def close(self):
+        self.entries.clear()
+
+    def status(self) -> dict:
+        return {"entries": len(self.entries), "maxEntries": self.max_entries, "evictions": self.evictions}
+
+
+class RedisBackend:
+
+    """
+    A cache shared by every worker. Entries expire through Redis TTLs; bound its
+    memory with `maxmemory` and the `allkeys-lru` policy on the server.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        await self.client.set(key, value, ex=ttl)
+
+    async def counter(self, key: str) -> int:
+        value = await self.client.get(key)
+        if value is None:
+            # The first worker to seed the counter wins
+            await self.client.set(key, seed_version(), nx=True)
+            value = await self.client.get(key)
+        return int(value)
+
+    async def incr(self, key: str) -> int:
+        await self.counter(key)
+        return await self.client.incr(key)
+
+    async def close(self):
+        await self.client.aclose()
+
+    def status(self) -> dict:
+        return {"backend": "redis"}
+
+
+class SingleFlight:
+
+    """
+    Share one in-flight call among concurrent callers asking for the same key.
+
+    The call runs in its own task, so a caller going away, e.g. a client
+    disconnecting, doesn't cancel it for the others waiting on it.
+    """
+
+    def __init__(self):
+        self.flights: dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+
+        """
+        Run the call, or wait for the one already running under the key.
+
+        Parameters:
+            key (str): Identifies identical calls.
+            call (Callable[[], Awaitable[Any]]): Produces the result; its exceptions reach every caller.
+
+        Returns:
+            tuple[Any, bool]: The result, and whether it came from another caller's flight.
+        """
+
+        flight = self.flights.get(key)
+        shared = flight is not None
+
+        if not shared:
+            flight = asyncio.ensure_future(call())
+            self.flights[key] = flight
+            flight.add_done_callback(lambda _: self.flights.pop(key, None))
+
+        return await asyncio.shield(flight), shared
+
+    def __len__(self) -> int:
+        return len(self.flights)
+
+
+def create_backend(url: str):
+
+    """
+    Create the cache backend for a CACHE_URL.
+
+    "fakeredis://" runs the Redis backend against an in-process stand-in, for
+    tests; it needs the fakeredis package.
+
+    Raises:
+        ValueError: If the scheme of the URL is not supported.
+    """
+
+    scheme = url.split("://", 1)[0]
+
+    if scheme == "memory":
+        return MemoryBackend(CACHE_MAX_ENTRIES)
+
+    if scheme in ("redis", "rediss", "unix"):
+        from redis import asyncio as redis
+        return RedisBackend(redis.from_url(url))
+
+    if scheme == "fakeredis":
+        from fakeredis import aioredis
+        return RedisBackend(aioredis.FakeRedis())
+
+    raise ValueError(f"Unsupported CACHE_URL scheme: {scheme}")
+
+
+class CatalogCache:
+
+    """
+    A read-through cache of catalog responses.
+
+    Every namespace has a version counter stored in the backend, and entries are
+    keyed under the current version, so bumping it invalidates every entry of the
+    namespace at once, in every worker sharing the backend.
+    """
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = defaultdict(lambda: {"hits": 0, "misses": 0, "coalesced": 0, "notModified": 0, "invalidations": 0})
+        self.flights = SingleFlight()
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self):
+
+        """
+        Remember the event loop serving requests, so that background threads can invalidate.
+        """
+
+        self.loop = asyncio.get_running_loop()
+
+    async def close(self):
+        await self.backend.close()
+        self.loop = None
+
+    async def version(self, namespace: str) -> int:
+        return await self.backend.counter(f"version:{namespace}")
+
+    async def fetch(
+        self,
+        namespace: str,
+        key: Any,
+        load: Callable[[AsyncSession], Awaitable[bytes]],
+        if_none_match: str | None = None
+    ) -> Response:
+
+        """
+        Serve a response from the cache, loading and caching it on a miss.
+
+        Concurrent misses of the same response share a single load and serialization.
+        Responses carry an ETag derived from their body, cached along with it, so a
+        client revalidating a response the cache holds gets a 304 without any query.
+
+        The load outlives the request that started it, so it gets a session of
+        its own: on a read replica, or on the primary for CACHE_PRIMARY_SECONDS
+        after the namespace was invalidated.
+
+        Parameters:
+            namespace (str): The namespace of the response, e.g. SONGS.
+            key (Any): The key of the response within the namespace, e.g. the song ID.
+            load (Callable[[AsyncSession], Awaitable[bytes]]): Loads the JSON body with the session;
+                exceptions, such as a 404, are not cached.
+            if_none_match (str | None): The If-None-Match header of the request.
+
+        Returns:
+            Response: The JSON response, or an empty 304 response.
+        """
+
+        version = await self.version(namespace)
+        entry_key = f"{namespace}:{version}:{key}"
+
+        async def fill() -> bytes:
+            primary = await self.invalidated_recently(namespace)
+            async with database.read_sessions(primary)() as db:
+                body = await load(db)
+
+            # Entries hold the ETag of their body on the first line
+            entry = body_etag(body, namespace, key).encode() + b"\n" + body
+            await self.backend.set(entry_key, entry, self.ttl)
+            return entry
+
+        entry = await self.backend.get(entry_key)
+        if entry is not None:
+            self.stats[namespace]["hits"] += 1
+        else:
+            # Requests missing the same entry wait for the first one's load
+            entry, shared = await self.flights.do(entry_key, fill)
+            self.stats[namespace]["coalesced" if shared else "misses"] += 1
+
+        tag, body = entry.split(b"\n", 1)
+        tag = tag.decode()
+
+        if etag_matches(if_none_match, tag):
+            self.stats[namespace]["notModified"] += 1
+            return not_modified(tag)
+
+        return Response(content=body, media_type="application/json", headers={"ETag": tag})
+
+    async def invalidate(self, *namespaces: str):
+
+        """
+        Drop every cached response of the namespaces, after a write changed them.
+        """
+
+        for namespace in namespaces:
+            await self.backend.incr(f"version:{namespace}")
+            self.stats[namespace]["invalidations"] += 1
+
+            # Mark the namespace, in every worker sharing the backend, as loading from the primary for a while
+            if database.replica_engines and CACHE_PRIMARY_SECONDS > 0:
+                await self.backend.set(f"invalidated:{namespace}", b"1", CACHE_PRIMARY_SECONDS)
+
+    async def invalidated_recently(self, namespace: str) -> bool:
+
+        """
+        Check whether the namespace was invalidated within CACHE_PRIMARY_SECONDS, when its loads read the primary.
+        """
+
+        if not database.replica_engines or CACHE_PRIMARY_SECONDS <= 0:
+            return False
+
+        return await self.backend.get(f"invalidated:{namespace}") is not None
+
+    def invalidate_threadsafe(self, *namespaces: str):
+
+        """
+        Invalidate namespaces from a background thread, such as an ingest worker.
+        """
+
+        if self.loop is not None and not self.loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self.invalidate(*namespaces), self.loop)
+
+    def status(self) -> dict:
+
+        """
+        Get the hit, miss, coalesced, not modified and invalidation counters of this worker, and the backend's usage.
+        """
+
+        return {
+            "ttlSeconds": self.ttl,
+            "inFlight": len(self.flights),
+            "namespaces": {namespace: dict(self.stats[namespace]) for namespace in CATALOG},
+            **self.backend.status()
+        }
+
+
+catalog = CatalogCache(create_backend(CACHE_URL), CACHE_TTL_SECONDS)
@@ -1,21 +1,216 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from typing import Annotated
-from fastapi import Depends
-from elasticsearch import Elasticsearch
+from fastapi import Depends, HTTPException, Request, Response, status
+from elasticsearch import Elasticsearch, AsyncElasticsearch, ApiError, ConnectionError, ConnectionTimeout
+from itertools import cycle
+from threading import Lock
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 
 # Load environment variables from the .env file
 load_dotenv()
 
+SQLALCHEMY_DATABASE_URL = os.environ.get("SQLALCHEMY_DATABASE_URL")
+
+# Comma-separated read replicas of the database, read-only routes use the primary when empty
+SQLALCHEMY_REPLICA_URLS = [
+    url.strip() for url in os.environ.get("SQLALCHEMY_REPLICA_URLS", "").split(",") if url.strip()
+]
+
+# Seconds a client keeps reading from the primary after it wrote, 0 disables read-your-writes
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 0))
+
+# Cookie remembering when a client last wrote
+LAST_WRITE_COOKIE = "lastWrite"
+
+# Async drivers used when no async URL is configured explicitly
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite",
+    "mysql": "aiomysql"
+}
+
+# Connection pool configuration
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Per-statement timeout in milliseconds, 0 disables it
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 0))
+
+
+class CheckoutStats:
+
+    """
+    Pool mixin that records how long checkouts wait for a connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self.stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+class InstrumentedQueuePool(CheckoutStats, QueuePool):
+
+    """
+    QueuePool of the sync engine with checkout telemetry.
+    """
+
+
+class InstrumentedAsyncQueuePool(CheckoutStats, AsyncAdaptedQueuePool):
+
+    """
+    QueuePool of the async engine with checkout telemetry.
+    """
+
+
+def async_url(url: str) -> str:
+
+    """
+    Derive the async driver URL of a database URL, e.g. postgresql:// -> postgresql+asyncpg://.
+
+    Parameters:
+        url (str): The database URL.
+
+    Returns:
+        str: The URL with the async driver of its backend.
+    """
+
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if not driver:
+        return url
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+def engine_options(url: str, asynchronous: bool = False) -> dict:
+
+    """
+    Build the create_engine options for a database URL from the pool configuration.
+
+    Parameters:
+        url (str): The database URL.
+        asynchronous (bool): Whether the options are for the async engine.
+
+    Returns:
+        dict: Keyword arguments for create_engine.
+    """
+
+    backend = make_url(url).get_backend_name()
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+
+    # SQLite connections are local files, they don't need a sized pool
+    if backend == "sqlite":
+        return options
+
+    options.update(
+        poolclass=InstrumentedAsyncQueuePool if asynchronous else InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE
+    )
+
+    # asyncpg takes server settings instead of libpq options
+    if DB_STATEMENT_TIMEOUT_MS and backend == "postgresql" and asynchronous:
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    elif DB_STATEMENT_TIMEOUT_MS and backend == "postgresql":
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+
+    return options
+
+
+def pool_status(engine) -> dict:
+
+    """
+    Report the usage of an engine's connection pool.
+
+    Parameters:
+        engine: The SQLAlchemy engine.
+
+    Returns:
+        dict: Pool size, checked-out, idle and overflow connections plus checkout wait times.
+    """
+
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+
+    # Read the limits from the pool itself, whatever options its engine was created with
+    usage = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checkedOut": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "maxOverflow": pool._max_overflow
+    }
+
+    if isinstance(pool, CheckoutStats):
+        with pool.stats_lock:
+            usage.update(
+                checkouts=pool.checkouts,
+                timeouts=pool.timeouts,
+                averageWaitMs=round(pool.wait_seconds / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+                maxWaitMs=round(pool.max_wait_seconds * 1000, 3)
+            )
+
+    return usage
+
+
 # Create a SQLAlchemy engine
-engine = create_engine(os.environ.get("SQLALCHEMY_DATABASE_URL"))
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+
+# Create an async engine on the same database for the request handlers
+SQLALCHEMY_ASYNC_DATABASE_URL = os.environ.get("SQLALCHEMY_ASYNC_DATABASE_URL") or async_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    **engine_options(SQLALCHEMY_ASYNC_DATABASE_URL, asynchronous=True)
+)
 
 # Create a session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Create an async session, objects stay usable after commit since they can't lazy load
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Create an async engine and session per read replica, taken in turn by read-only routes
+replica_engines = [
+    create_async_engine(async_url(url), **engine_options(async_url(url), asynchronous=True))
+    for url in SQLALCHEMY_REPLICA_URLS
+]
+ReplicaSessions = cycle([
+    async_sessionmaker(replica, autoflush=False, expire_on_commit=False) for replica in replica_engines
+])
+
 # Create a base class for declarative models
 Base = declarative_base()
 
@@ -37,14 +232,190 @@ def get_db():
 # Annotated dependency for FastAPI to inject the database session
 db_dependency = Annotated[Session, Depends(get_db)]
 
+async def get_async_db(response: Response):
+
+    """
+    Dependency function to provide an async database session on the primary.
+
+    With READ_YOUR_WRITES_SECONDS set, a commit that wrote anything marks the
+    client with a cookie so its next reads also go to the primary.
+
+    Returns:
+        AsyncSession: The SQLAlchemy async database session.
+    """
+
+    async with AsyncSessionLocal() as db:
+        if READ_YOUR_WRITES_SECONDS > 0:
+            remember_writes(db, response)
+        yield db
+
+
+def remember_writes(db: AsyncSession, response: Response):
+
+    """
+    Set the last-write cookie on the response whenever the session commits a write.
+    """
+
+    def after_flush(session, flush_context):
+        session.info["wrote"] = True
+
+    def after_commit(session):
+        if session.info.pop("wrote", False):
+            response.set_cookie(
+                LAST_WRITE_COOKIE,
+                str(time.time()),
+                max_age=int(READ_YOUR_WRITES_SECONDS) + 1,
+                httponly=True,
+                samesite="lax"
+            )
+
+    event.listen(db.sync_session, "after_flush", after_flush)
+    event.listen(db.sync_session, "after_commit", after_commit)
+
+
+def wrote_recently(request: Request) -> bool:
+
+    """
+    Check whether the client wrote within the read-your-writes window.
+    """
+
+    if READ_YOUR_WRITES_SECONDS <= 0:
+        return False
+
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        return False
+
+    return time.time() - last_write < READ_YOUR_WRITES_SECONDS
+
+# Annotated dependency for FastAPI to inject the async database session
+async_db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+
+def read_sessions(primary: bool = False) -> async_sessionmaker:
+
+    """
+    Get the session factory of the next read replica in round-robin order, or of
+    the primary when asked for or when no replica is configured.
+    """
+
+    return AsyncSessionLocal if primary or not replica_engines else next(ReplicaSessions)
+
+
+async def get_read_db(request: Request):
+
+    """
+    Dependency function to provide a read-only async database session.
+
+    Sessions are bound to the read replicas in round-robin order, or to the
+    primary when no replica is configured or the client wrote recently.
+
+    Returns:
+        AsyncSession: The SQLAlchemy async database session.
+    """
+
+    async with read_sessions(wrote_recently(request))() as db:
+        yield db
+
+# Annotated dependency for FastAPI to inject a read-only database session
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+
 # Elasticsearch Configuration
 ELASTICSEARCH_URL = os.environ.get("ELASTICSEARCH_URL")
 ELASTICSEARCH_USER = os.environ.get("ELASTICSEARCH_USER")
 ELASTICSEARCH_PASSWORD = os.environ.get("ELASTICSEARCH_PASSWORD")
 
-# Create an Elasticsearch instance
+# Connections kept open to every Elasticsearch node
+ES_CONNECTIONS_PER_NODE = int(os.environ.get("ES_CONNECTIONS_PER_NODE", 10))
+
+# Seconds a single Elasticsearch call may take
+ES_REQUEST_TIMEOUT = float(os.environ.get("ES_REQUEST_TIMEOUT", 10))
+
+# Attempts after the first for transient failures, with exponential backoff from ES_RETRY_BACKOFF seconds
+ES_MAX_RETRIES = int(os.environ.get("ES_MAX_RETRIES", 3))
+ES_RETRY_BACKOFF = float(os.environ.get("ES_RETRY_BACKOFF", 0.2))
+
+# Statuses that mean the cluster is busy rather than the request being wrong
+ES_RETRY_STATUSES = {429, 502, 503, 504}
+
+# Create an Elasticsearch instance for the background workers
 es = Elasticsearch(
     hosts=ELASTICSEARCH_URL,
     basic_auth=(ELASTICSEARCH_USER, ELASTICSEARCH_PASSWORD),
-    verify_certs=True
+    verify_certs=True,
+    connections_per_node=ES_CONNECTIONS_PER_NODE,
+    request_timeout=ES_REQUEST_TIMEOUT,
+    max_retries=ES_MAX_RETRIES,
+    retry_on_timeout=True
 )
+
+
+def create_async_es() -> AsyncElasticsearch:
+
+    """
+    Create the async Elasticsearch client shared by the request handlers.
+
+    Retries are left to `es_call`, which backs off between attempts.
+
+    Returns:
+        AsyncElasticsearch: The client, to be closed when the application stops.
+    """
+
+    return AsyncElasticsearch(
+        hosts=ELASTICSEARCH_URL,
+        basic_auth=(ELASTICSEARCH_USER, ELASTICSEARCH_PASSWORD),
+        verify_certs=True,
+        connections_per_node=ES_CONNECTIONS_PER_NODE,
+        request_timeout=ES_REQUEST_TIMEOUT,
+        max_retries=0
+    )
+
+
+async def es_call(method, *args, **kwargs):
+
+    """
+    Call an async Elasticsearch API, retrying transient failures with exponential backoff.
+
+    Parameters:
+        method: A bound method of the async client, e.g. `es.search`.
+        *args, **kwargs: The arguments of the call.
+
+    Raises:
+        HTTPException: If Elasticsearch is still unreachable or overloaded after the retries (HTTP 503).
+
+    Returns:
+        The response of the call.
+    """
+
+    for attempt in range(ES_MAX_RETRIES + 1):
+        try:
+            return await method(*args, **kwargs)
+        except (ConnectionError, ConnectionTimeout):
+            pass
+        except ApiError as error:
+            if error.meta.status not in ES_RETRY_STATUSES:
+                raise
+
+        # Wait 0.2s, 0.4s, 0.8s, ... before the next attempt
+        if attempt < ES_MAX_RETRIES:
+            await asyncio.sleep(ES_RETRY_BACKOFF * 2 ** attempt)
+
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Search is temporarily unavailable"
+    )
+
+
+def get_es(request: Request) -> AsyncElasticsearch:
+
+    """
+    Dependency function to provide the async Elasticsearch client created by the application lifespan.
+
+    Returns:
+        AsyncElasticsearch: The shared client.
+    """
+
+    return request.app.state.es
+
+# Annotated dependency for FastAPI to inject the async Elasticsearch client
+es_dependency = Annotated[AsyncElasticsearch, Depends(get_es)]
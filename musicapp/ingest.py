@@ -0,0 +1,590 @@
+import csv
+import io
+import os
+import time
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+from threading import BoundedSemaphore, Lock
+from uuid import uuid4
+
+from elasticsearch import helpers
+from sqlalchemy import insert, select, text
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import es
+
+# Number of CSV rows written to the database per transaction
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 5000))
+
+# "auto" loads through COPY on PostgreSQL and through ORM batches elsewhere, "orm" always uses batches
+INGEST_MODE = os.environ.get("INGEST_MODE", "auto")
+
+# Number of processes parsing the files of a multi-file ingest
+INGEST_PARSE_WORKERS = int(os.environ.get("INGEST_PARSE_WORKERS", os.cpu_count() or 1))
+
+# Elasticsearch bulk indexing configuration
+ES_BULK_CHUNK_SIZE = int(os.environ.get("ES_BULK_CHUNK_SIZE", 500))
+ES_BULK_WORKERS = int(os.environ.get("ES_BULK_WORKERS", 4))
+ES_BULK_QUEUE_SIZE = int(os.environ.get("ES_BULK_QUEUE_SIZE", 16))
+
+
+def read_batches(stream, batch_size: int = INGEST_BATCH_SIZE, skip: int = 0):
+
+    """
+    Parse a CSV text stream into fixed-size batches of rows.
+
+    Parameters:
+        stream: A text file object positioned at the first CSV row.
+        batch_size (int): The maximum number of rows per batch.
+        skip (int): The number of leading rows to skip, used to resume an ingest.
+
+    Returns:
+        generator: Lists of at most `batch_size` parsed rows.
+    """
+
+    reader = csv.reader(stream)
+    deque(islice(reader, skip), maxlen=0)
+    while True:
+        batch = list(islice(reader, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_file(path: str) -> list[list[str]]:
+
+    """
+    Parse and normalise one catalog file, meant to run in a worker process.
+
+    Blank and malformed lines are dropped, extra columns are cut and only the
+    first row of every song name is kept.
+
+    Parameters:
+        path (str): The path of the CSV file.
+
+    Returns:
+        list[list[str]]: The normalised rows in file order.
+    """
+
+    rows = {}
+    with open(path, encoding="utf-8", newline="") as stream:
+        for row in csv.reader(stream):
+            if len(row) >= 4 and row[0] not in rows:
+                rows[row[0]] = row[:4]
+
+    return list(rows.values())
+
+
+def merge_files(
+    paths: list[str],
+    batch_size: int = INGEST_BATCH_SIZE,
+    workers: int = INGEST_PARSE_WORKERS,
+    skip: int = 0
+):
+
+    """
+    Parse several catalog files in a process pool and merge them into deduplicated batches.
+
+    Files are parsed concurrently but merged in the order of `paths`, so the
+    batches are the same on every run and `skip` can resume a previous run.
+
+    Parameters:
+        paths (list[str]): The paths of the CSV files.
+        batch_size (int): The maximum number of rows per batch.
+        workers (int): The number of parsing processes.
+        skip (int): The number of leading merged rows to skip.
+
+    Returns:
+        generator: Lists of at most `batch_size` rows with unique song names.
+    """
+
+    seen = set()
+    batch = []
+    position = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded window of files in flight so parsed rows don't pile up
+        pending = deque()
+        files = iter(paths)
+
+        for path in islice(files, workers * 2):
+            pending.append(pool.submit(parse_file, path))
+
+        while pending:
+            rows = pending.popleft().result()
+            for path in islice(files, 1):
+                pending.append(pool.submit(parse_file, path))
+
+            for row in rows:
+                if row[0] in seen:
+                    continue
+                seen.add(row[0])
+                position += 1
+                if position <= skip:
+                    continue
+
+                batch.append(row)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+
+    if batch:
+        yield batch
+
+
+class CatalogIngest:
+
+    """
+    Bulk loader for catalog rows of the form songName, artistName, albumName, genreName.
+
+    Artists, genres and albums are resolved through in-memory name to id
+    dictionaries, so each batch costs a handful of bulk statements and a
+    single commit no matter how many rows it holds.
+    """
+
+    def __init__(self, db: Session, job: models.IngestJob | None = None):
+        self.db = db
+        self.job = job
+
+        # Load the dimension tables once, they are small compared to songs
+        self.artists = dict(db.execute(select(models.Artist.artistName, models.Artist.id)).all())
+        self.genres = dict(db.execute(select(models.Genre.genreName, models.Genre.id)).all())
+        self.albums = dict(db.execute(select(models.Album.albumName, models.Album.id)).all())
+
+        self.rows = 0
+        self.skipped = 0
+        self.songs_created = 0
+        self.started = time.perf_counter()
+
+    def _insert_missing(self, model, name_column, cache: dict, values: list[dict]):
+
+        # Insert the rows whose name is not cached yet and cache the new ids
+        missing = {}
+        for value in values:
+            name = value[name_column.key]
+            if name not in cache and name not in missing:
+                missing[name] = value
+
+        if missing:
+            result = self.db.execute(
+                insert(model).returning(model.id, name_column),
+                list(missing.values())
+            )
+            cache.update({name: id for id, name in result})
+
+    def write_batch(self, rows: list[list[str]]) -> list[dict]:
+
+        """
+        Write one batch of CSV rows in a single transaction.
+
+        Parameters:
+            rows (list[list[str]]): Parsed CSV rows.
+
+        Returns:
+            list[dict]: Elasticsearch documents for every song in the batch.
+        """
+
+        # Drop blank and malformed lines
+        valid = [row for row in rows if len(row) >= 4]
+        self.skipped += len(rows) - len(valid)
+        self.rows += len(rows)
+
+        songs, created = self._write_rows(valid) if valid else ({}, 0)
+        self.songs_created += created
+
+        # Record the progress of the job in the same transaction as the rows
+        if self.job is not None:
+            self.job.rowsProcessed += len(rows)
+            self.job.songsCreated += created
+            self.job.updatedAt = datetime.utcnow()
+
+        self.db.commit()
+
+        # Build the search documents with the ids of the stored songs
+        return [
+            {
+                "songId": songs[row[0]],
+                "songName": row[0],
+                "artistName": row[1],
+                "genreName": row[3],
+                "albumName": row[2]
+            }
+            for row in valid
+        ]
+
+    def _write_rows(self, valid: list[list[str]]) -> tuple[dict, int]:
+
+        # Create the missing artists and genres, then the albums that reference them
+        self._insert_missing(
+            models.Artist, models.Artist.artistName, self.artists,
+            [{"artistName": row[1]} for row in valid]
+        )
+        self._insert_missing(
+            models.Genre, models.Genre.genreName, self.genres,
+            [{"genreName": row[3]} for row in valid]
+        )
+        self._insert_missing(
+            models.Album, models.Album.albumName, self.albums,
+            [{"albumName": row[2], "artistId": self.artists[row[1]]} for row in valid]
+        )
+
+        # Look up the songs of this batch that already exist with one query
+        names = {row[0] for row in valid}
+        songs = dict(self.db.execute(
+            select(models.Songs.songName, models.Songs.id).where(models.Songs.songName.in_(names))
+        ).all())
+
+        # Bulk insert the new songs and collect their generated ids
+        new_songs = {}
+        for row in valid:
+            if row[0] not in songs and row[0] not in new_songs:
+                new_songs[row[0]] = {
+                    "songName": row[0],
+                    "artistId": self.artists[row[1]],
+                    "genreId": self.genres[row[3]],
+                    "albumId": self.albums[row[2]]
+                }
+
+        if new_songs:
+            result = self.db.execute(
+                insert(models.Songs).returning(models.Songs.id, models.Songs.songName),
+                list(new_songs.values())
+            )
+            songs.update({name: id for id, name in result})
+
+        return songs, len(new_songs)
+
+    def stats(self) -> dict:
+
+        """
+        Summarise the progress of the ingest.
+
+        Returns:
+            dict: Rows read, rows skipped, songs created, elapsed seconds and rows per second.
+        """
+
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows": self.rows,
+            "skipped": self.skipped,
+            "songsCreated": self.songs_created,
+            "seconds": round(elapsed, 3),
+            "rowsPerSecond": round(self.rows / elapsed, 1) if elapsed else 0.0
+        }
+
+
+def use_copy(db: Session) -> bool:
+
+    """
+    Tell whether an ingest should use the PostgreSQL COPY fast path.
+
+    Parameters:
+        db (Session): The database session.
+
+    Returns:
+        bool: True when the database is PostgreSQL reached through psycopg2, whose
+              `copy_expert` the fast path streams with, and the ORM mode is not forced.
+    """
+
+    dialect = db.get_bind().dialect
+    return INGEST_MODE != "orm" and dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+class _CsvPipe:
+
+    """
+    Read-only file object that feeds normalised CSV rows to COPY.
+
+    Blank and malformed lines are dropped and extra columns are cut, so the
+    stage receives exactly the rows the ORM path would accept.
+    """
+
+    def __init__(self, stream, skip: int = 0, block_rows: int = 1000):
+        self.reader = csv.reader(stream)
+        deque(islice(self.reader, skip), maxlen=0)
+        self.block_rows = block_rows
+        self.buffer = ""
+        self.line = skip
+        self.rows = 0
+        self.skipped = 0
+
+    def _next_block(self) -> str:
+
+        # Re-encode a block of valid rows, numbering them to keep the file order
+        block = io.StringIO()
+        writer = csv.writer(block)
+        for row in islice(self.reader, self.block_rows):
+            self.rows += 1
+            self.line += 1
+            if len(row) < 4:
+                self.skipped += 1
+                continue
+            writer.writerow([self.line, row[0], row[1], row[2], row[3]])
+        return block.getvalue()
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.buffer) < size:
+            rows = self.rows
+            block = self._next_block()
+            self.buffer += block
+            if self.rows == rows:
+                break
+
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class CopyIngest:
+
+    """
+    PostgreSQL fast path that loads a catalog CSV without building ORM objects.
+
+    The rows are COPYed into an unlogged staging table and set-based statements
+    create the missing artists, genres, albums and songs in one transaction.
+    """
+
+    def __init__(self, db: Session, job: models.IngestJob | None = None):
+        self.db = db
+        self.job = job
+        self.stage = f"ingest_stage_{job.id.replace('-', '') if job else uuid4().hex}"
+        self.rows = 0
+        self.skipped = 0
+        self.songs_created = 0
+        self.started = time.perf_counter()
+
+    def load(self, stream, skip: int = 0):
+
+        """
+        Stage the CSV rows and upsert the catalog tables from the stage.
+
+        Parameters:
+            stream: A text file object positioned at the first CSV row.
+            skip (int): The number of leading rows to skip.
+        """
+
+        stage = self.stage
+
+        # Stage the normalised rows with COPY
+        self.db.execute(text(f"DROP TABLE IF EXISTS {stage}"))
+        self.db.execute(text(
+            f'CREATE UNLOGGED TABLE {stage} '
+            f'(line bigint, "songName" text, "artistName" text, "albumName" text, "genreName" text)'
+        ))
+
+        pipe = _CsvPipe(stream, skip=skip)
+        cursor = self.db.connection().connection.cursor()
+        cursor.copy_expert(
+            f'COPY {stage} (line, "songName", "artistName", "albumName", "genreName") FROM STDIN WITH (FORMAT csv)',
+            pipe
+        )
+        cursor.close()
+        self.db.execute(text(f"ANALYZE {stage}"))
+
+        self.rows = pipe.rows
+        self.skipped = pipe.skipped
+
+        # Create the artists and genres that do not exist yet
+        self.db.execute(text(
+            f'INSERT INTO artist ("artistName") '
+            f'SELECT DISTINCT s."artistName" FROM {stage} s '
+            f'WHERE NOT EXISTS (SELECT 1 FROM artist a WHERE a."artistName" = s."artistName")'
+        ))
+        self.db.execute(text(
+            f'INSERT INTO genre ("genreName") '
+            f'SELECT DISTINCT s."genreName" FROM {stage} s '
+            f'WHERE NOT EXISTS (SELECT 1 FROM genre g WHERE g."genreName" = s."genreName")'
+        ))
+
+        # Create the missing albums with the artist of their first row
+        self.db.execute(text(
+            f'INSERT INTO album ("albumName", "artistId") '
+            f'SELECT DISTINCT ON (s."albumName") s."albumName", a.id FROM {stage} s '
+            f'JOIN artist a ON a."artistName" = s."artistName" '
+            f'WHERE NOT EXISTS (SELECT 1 FROM album al WHERE al."albumName" = s."albumName") '
+            f'ORDER BY s."albumName", s.line, a.id'
+        ))
+
+        # Create the missing songs from their first row
+        self.songs_created = self.db.execute(text(
+            f'INSERT INTO songs ("songName", "artistId", "genreId", "albumId") '
+            f'SELECT DISTINCT ON (s."songName") s."songName", a.id, g.id, al.id FROM {stage} s '
+            f'JOIN artist a ON a."artistName" = s."artistName" '
+            f'JOIN genre g ON g."genreName" = s."genreName" '
+            f'JOIN album al ON al."albumName" = s."albumName" '
+            f'WHERE NOT EXISTS (SELECT 1 FROM songs x WHERE x."songName" = s."songName") '
+            f'ORDER BY s."songName", s.line, a.id, g.id, al.id'
+        )).rowcount
+
+        # Record the progress of the job in the same transaction as the rows
+        if self.job is not None:
+            self.job.rowsProcessed += self.rows
+            self.job.songsCreated += self.songs_created
+            self.job.updatedAt = datetime.utcnow()
+
+        self.db.commit()
+
+    def documents(self, chunk_size: int = ES_BULK_CHUNK_SIZE):
+
+        """
+        Stream the search documents of the staged rows.
+
+        Parameters:
+            chunk_size (int): The number of documents per yielded list.
+
+        Returns:
+            generator: Lists of song documents carrying their `songId`.
+        """
+
+        result = self.db.execute(
+            text(
+                f'SELECT DISTINCT ON (s.line) x.id, s."songName", s."artistName", s."genreName", s."albumName" '
+                f'FROM {self.stage} s JOIN songs x ON x."songName" = s."songName" ORDER BY s.line, x.id'
+            ),
+            execution_options={"yield_per": chunk_size}
+        )
+
+        for rows in result.partitions():
+            yield [
+                {
+                    "songId": row[0],
+                    "songName": row[1],
+                    "artistName": row[2],
+                    "genreName": row[3],
+                    "albumName": row[4]
+                }
+                for row in rows
+            ]
+
+        self.db.commit()
+
+    def drop(self):
+
+        """
+        Remove the staging table.
+        """
+
+        self.db.rollback()
+        self.db.execute(text(f"DROP TABLE IF EXISTS {self.stage}"))
+        self.db.commit()
+
+    def stats(self) -> dict:
+
+        """
+        Summarise the load.
+
+        Returns:
+            dict: Rows read, rows skipped, songs created, elapsed seconds and rows per second.
+        """
+
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows": self.rows,
+            "skipped": self.skipped,
+            "songsCreated": self.songs_created,
+            "seconds": round(elapsed, 3),
+            "rowsPerSecond": round(self.rows / elapsed, 1) if elapsed else 0.0
+        }
+
+
+class BulkIndexer:
+
+    """
+    Background stage that streams song documents into Elasticsearch bulk requests.
+
+    Documents are grouped into chunks of `chunk_size` and sent by a pool of
+    `workers` threads, so the SQL writer only blocks once `queue_size` chunks
+    are waiting to be indexed. Every failed chunk is reported with its errors.
+    """
+
+    def __init__(
+        self,
+        index: str = "songs",
+        chunk_size: int = ES_BULK_CHUNK_SIZE,
+        workers: int = ES_BULK_WORKERS,
+        queue_size: int = ES_BULK_QUEUE_SIZE
+    ):
+        self.index = index
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="es-bulk")
+        self.slots = BoundedSemaphore(workers + queue_size)
+        self.lock = Lock()
+        self.buffer = []
+        self.futures = []
+        self.chunks = 0
+        self.indexed = 0
+        self.failed = 0
+        self.failed_chunks = []
+
+    def add(self, documents: list[dict]):
+
+        """
+        Queue song documents for indexing.
+
+        Parameters:
+            documents (list[dict]): Song documents carrying their `songId`.
+        """
+
+        self.buffer.extend(documents)
+        while len(self.buffer) >= self.chunk_size:
+            self._submit(self.buffer[:self.chunk_size])
+            del self.buffer[:self.chunk_size]
+
+    def _submit(self, chunk: list[dict]):
+
+        # Wait for a free slot so memory stays bounded when Elasticsearch falls behind
+        self.slots.acquire()
+        self.chunks += 1
+        future = self.executor.submit(self._send, self.chunks, chunk)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+
+    def _send(self, number: int, chunk: list[dict]):
+
+        actions = [
+            {"_index": self.index, "_id": document["songId"], "_source": document}
+            for document in chunk
+        ]
+
+        try:
+            indexed, errors = helpers.bulk(es, actions, raise_on_error=False, raise_on_exception=False)
+        except Exception as exc:
+            indexed, errors = 0, [str(exc)]
+
+        with self.lock:
+            self.indexed += indexed
+            if errors:
+                self.failed += len(chunk) - indexed
+                self.failed_chunks.append({
+                    "chunk": number,
+                    "size": len(chunk),
+                    "indexed": indexed,
+                    "errors": errors[:5]
+                })
+
+    def close(self) -> dict:
+
+        """
+        Flush the remaining documents and wait for every chunk to be indexed.
+
+        Returns:
+            dict: Indexed and failed document counts plus the report of every failed chunk.
+        """
+
+        if self.buffer:
+            self._submit(self.buffer)
+            self.buffer = []
+
+        wait(self.futures)
+        self.executor.shutdown()
+
+        return {
+            "chunks": self.chunks,
+            "indexed": self.indexed,
+            "failed": self.failed,
+            "failedChunks": sorted(self.failed_chunks, key=lambda report: report["chunk"])
+        }
@@ -0,0 +1,298 @@
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import models, ingest, cache
+from .database import SessionLocal
+
+# Directory where uploaded catalog files are kept until their job completes
+INGEST_DIR = os.environ.get("INGEST_DIR", "files/ingest")
+
+# Number of ingest jobs processed concurrently
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+
+# Running jobs without progress for this long are considered abandoned
+INGEST_STALE_SECONDS = int(os.environ.get("INGEST_STALE_SECONDS", 300))
+
+# Running jobs mark their progress this often, well within INGEST_STALE_SECONDS
+INGEST_HEARTBEAT_SECONDS = max(INGEST_STALE_SECONDS / 3, 1)
+
+executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+logger = logging.getLogger(__name__)
+
+
+def save_source(upload) -> tuple[str, str]:
+
+    """
+    Persist an uploaded CSV file for a new ingest job.
+
+    Parameters:
+        upload: A binary file object holding the CSV content.
+
+    Returns:
+        tuple[str, str]: The ID of the new job and the path of its source file.
+    """
+
+    job_id = str(uuid4())
+    os.makedirs(INGEST_DIR, exist_ok=True)
+    source = os.path.join(INGEST_DIR, f"{job_id}.csv")
+
+    # Copy the upload to disk in bounded chunks
+    with open(source, "wb") as destination:
+        shutil.copyfileobj(upload, destination, 1024 * 1024)
+
+    return job_id, source
+
+
+def save_sources(uploads: list) -> tuple[str, str]:
+
+    """
+    Persist several uploaded CSV files for one new ingest job.
+
+    Parameters:
+        uploads (list): Binary file objects holding the CSV content, in merge order.
+
+    Returns:
+        tuple[str, str]: The ID of the new job and the directory of its source files.
+    """
+
+    job_id = str(uuid4())
+    source = os.path.join(INGEST_DIR, job_id)
+    os.makedirs(source, exist_ok=True)
+
+    # Number the files so the merge order survives a resume
+    for number, upload in enumerate(uploads):
+        with open(os.path.join(source, f"{number:06d}.csv"), "wb") as destination:
+            shutil.copyfileobj(upload, destination, 1024 * 1024)
+
+    return job_id, source
+
+
+def submit(job_id: str):
+
+    """
+    Schedule a job on the ingest worker pool.
+
+    Parameters:
+        job_id (str): The ID of the job to run.
+    """
+
+    executor.submit(run_job, job_id)
+
+
+class Heartbeat:
+
+    """
+    Touch the updatedAt of a running job every INGEST_HEARTBEAT_SECONDS, from a
+    thread and a session of its own, so that a long transaction, such as a COPY
+    load or a large merge, doesn't make a live job look abandoned.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(INGEST_HEARTBEAT_SECONDS):
+            db = SessionLocal()
+            try:
+                db.execute(
+                    update(models.IngestJob)
+                    .where(models.IngestJob.id == self.job_id, models.IngestJob.status == "running")
+                    .values(updatedAt=datetime.utcnow())
+                )
+                db.commit()
+            except Exception:
+                logger.exception("Heartbeat of ingest job %s failed", self.job_id)
+            finally:
+                db.close()
+
+
+def run_job(job_id: str):
+
+    """
+    Process a queued ingest job, starting after its last committed batch.
+
+    Parameters:
+        job_id (str): The ID of the job to run.
+    """
+
+    db = SessionLocal()
+    try:
+        # Claim the job so that no other worker processes it concurrently
+        now = datetime.utcnow()
+        claimed = db.execute(
+            update(models.IngestJob)
+            .where(models.IngestJob.id == job_id, models.IngestJob.status == "queued")
+            .values(
+                status="running",
+                startedAt=now,
+                updatedAt=now,
+                finishedAt=None,
+                resumedFrom=models.IngestJob.rowsProcessed
+            )
+        ).rowcount
+        db.commit()
+
+        if not claimed:
+            return
+
+        job = db.get(models.IngestJob, job_id)
+        indexer = ingest.BulkIndexer()
+        errors = list(job.errors or [])
+
+        try:
+            # Keep the job marked as alive while it runs
+            with Heartbeat(job_id):
+                process(db, job, indexer)
+        except Exception as exc:
+            db.rollback()
+            job.status = "failed"
+            errors.append(f"Ingest stopped after row {job.rowsProcessed}: {exc}")
+        else:
+            job.status = "completed"
+        finally:
+            report = indexer.close()
+
+        # Record the outcome of the indexing stage
+        job.indexed += report["indexed"]
+        job.indexFailed += report["failed"]
+        errors.extend(
+            f"Index chunk {chunk['chunk']} failed for {chunk['size'] - chunk['indexed']} songs: {chunk['errors']}"
+            for chunk in report["failedChunks"]
+        )
+        job.errors = errors[-50:]
+        job.updatedAt = job.finishedAt = datetime.utcnow()
+        db.commit()
+
+        # The committed batches may have added songs, albums, artists and genres
+        cache.catalog.invalidate_threadsafe(*cache.CATALOG)
+
+        # The source files are no longer needed once every row is in
+        if job.status == "completed" and os.path.isdir(job.source):
+            shutil.rmtree(job.source)
+        elif job.status == "completed" and os.path.exists(job.source):
+            os.remove(job.source)
+    finally:
+        db.close()
+
+
+def process(db: Session, job: models.IngestJob, indexer: ingest.BulkIndexer):
+
+    """
+    Load the rows of a running job, skipping those already covered by committed batches.
+
+    Parameters:
+        db (Session): The database session.
+        job (models.IngestJob): The running job.
+        indexer (ingest.BulkIndexer): The indexing stage receiving the song documents.
+    """
+
+    if os.path.isdir(job.source):
+        paths = sorted(os.path.join(job.source, name) for name in os.listdir(job.source))
+        catalog = ingest.CatalogIngest(db, job=job)
+        for batch in ingest.merge_files(paths, skip=job.rowsProcessed):
+            indexer.add(catalog.write_batch(batch))
+    else:
+        with open(job.source, encoding="utf-8", newline="") as stream:
+            if ingest.use_copy(db):
+                copy_load(db, job, stream, indexer)
+            else:
+                catalog = ingest.CatalogIngest(db, job=job)
+                for batch in ingest.read_batches(stream, skip=job.rowsProcessed):
+                    indexer.add(catalog.write_batch(batch))
+
+
+def copy_load(db: Session, job: models.IngestJob, stream, indexer: ingest.BulkIndexer):
+
+    """
+    Load a job through the PostgreSQL COPY fast path and index the staged songs.
+
+    Parameters:
+        db (Session): The database session.
+        job (models.IngestJob): The running job.
+        stream: The CSV text stream of the job.
+        indexer (ingest.BulkIndexer): The indexing stage receiving the song documents.
+    """
+
+    loader = ingest.CopyIngest(db, job=job)
+    try:
+        loader.load(stream, skip=job.rowsProcessed)
+        for documents in loader.documents():
+            indexer.add(documents)
+    finally:
+        loader.drop()
+
+
+def is_stale(job: models.IngestJob) -> bool:
+
+    """
+    Check whether a job is left running by a worker that went away, i.e. without progress for INGEST_STALE_SECONDS.
+    """
+
+    stale = datetime.utcnow() - timedelta(seconds=INGEST_STALE_SECONDS)
+    return job.status == "running" and job.updatedAt is not None and job.updatedAt < stale
+
+
+def resume_pending():
+
+    """
+    Requeue abandoned jobs and schedule every queued job, used at application startup.
+    """
+
+    db = SessionLocal()
+    try:
+        # Jobs left running by a worker that went away resume from their last batch
+        stale = datetime.utcnow() - timedelta(seconds=INGEST_STALE_SECONDS)
+        db.execute(
+            update(models.IngestJob)
+            .where(models.IngestJob.status == "running", models.IngestJob.updatedAt < stale)
+            .values(status="queued")
+        )
+        db.commit()
+
+        queued = db.query(models.IngestJob.id).filter(models.IngestJob.status == "queued").all()
+    finally:
+        db.close()
+
+    for (job_id,) in queued:
+        submit(job_id)
+
+
+def rows_per_second(job: models.IngestJob) -> float:
+
+    """
+    Compute the throughput of the current or last run of a job.
+
+    Parameters:
+        job (models.IngestJob): The ingest job.
+
+    Returns:
+        float: Rows processed per second since the job was last started.
+    """
+
+    if not job.startedAt:
+        return 0.0
+
+    end = job.finishedAt or datetime.utcnow()
+    elapsed = (end - job.startedAt).total_seconds()
+    rows = job.rowsProcessed - job.resumedFrom
+
+    return round(rows / elapsed, 1) if elapsed > 0 else 0.0
@@ -0,0 +1,125 @@
+from sqlalchemy import Update, select, update
+from sqlalchemy.orm import joinedload, raiseload
+
+from . import models, pagination
+
+# Every loader ends with raiseload("*"), so a relationship a response needs but
+# the loader forgot fails loudly instead of issuing one SELECT per row.
+# Lists of songs, albums and playlist entries are never loaded through a
+# relationship; they are selected a page at a time.
+
+
+def song_details() -> tuple:
+
+    """
+    Load the artist, genre and album of songs in the same SELECT as the songs.
+
+    Returns:
+        tuple: Loader options for a query or a relationship returning songs.
+    """
+
+    return (
+        joinedload(models.Songs.artist),
+        joinedload(models.Songs.genre),
+        joinedload(models.Songs.album),
+        raiseload("*")
+    )
+
+
+def song() -> tuple:
+
+    """
+    Loader options for `ShowSong`, one query.
+    """
+
+    return song_details()
+
+
+def playlist_info() -> tuple:
+
+    """
+    Loader options for `ShowPlaylistInfo` without its entries: the playlist with its owner, one query.
+    """
+
+    return (
+        joinedload(models.Playlist.users),
+        raiseload("*")
+    )
+
+
+async def song_page(db, condition, page: pagination.PageParams) -> dict:
+
+    """
+    Select a page of the songs matching a condition, with their details, in one query.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        condition: The WHERE clause, e.g. `models.Songs.albumId == albumId`.
+        page (pagination.PageParams): The page to select.
+
+    Returns:
+        dict: A page of `models.Songs`, for `schemas.Page[schemas.ShowSong]`.
+    """
+
+    query = select(models.Songs).where(condition).options(*song_details())
+    rows = (await db.scalars(pagination.keyset(query, models.Songs.id, page))).all()
+    return pagination.page_of(rows, page)
+
+
+async def album_page(db, artistId: int, page: pagination.PageParams) -> dict:
+
+    """
+    Select a page of the albums of an artist, in one query.
+
+    Returns:
+        dict: A page of `models.Album`, for `schemas.Page[schemas.Album]`.
+    """
+
+    query = select(models.Album).where(models.Album.artistId == artistId).options(raiseload("*"))
+    rows = (await db.scalars(pagination.keyset(query, models.Album.id, page))).all()
+    return pagination.page_of(rows, page)
+
+
+async def playlist_song_page(db, playlistId: int, page: pagination.PageParams) -> dict:
+
+    """
+    Select a page of the entries of a playlist, in the order they were added,
+    with their songs and the songs' details, in one query.
+
+    Returns:
+        dict: A page of `models.PlaylistSong`, for `schemas.Page[schemas.PlaylistSongs]`.
+    """
+
+    query = (
+        select(models.PlaylistSong)
+        .where(models.PlaylistSong.playlistId == playlistId)
+        .options(joinedload(models.PlaylistSong.songs).options(*song_details()), raiseload("*"))
+    )
+    rows = (await db.scalars(pagination.keyset(query, models.PlaylistSong.id, page))).all()
+    return pagination.page_of(rows, page)
+
+
+def touch_playlists(condition) -> Update:
+
+    """
+    Bump the version of the playlists holding the songs matching a condition, so that the
+    entity tags of their responses change along with the details of their entries.
+
+    Parameters:
+        condition: The WHERE clause on `models.Songs`, e.g. `models.Songs.albumId == albumId`.
+
+    Returns:
+        Update: The statement, to run in the transaction changing the songs.
+    """
+
+    holding = (
+        select(models.PlaylistSong.playlistId)
+        .join(models.Songs, models.Songs.id == models.PlaylistSong.songId)
+        .where(condition)
+    )
+    return (
+        update(models.Playlist)
+        .where(models.Playlist.id.in_(holding))
+        .values(version=models.Playlist.version + 1)
+        .execution_options(synchronize_session=False)
+    )
@@ -1,11 +1,85 @@
-import csv
-from fastapi import FastAPI, UploadFile, HTTPException, status
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from . import models, database
-from .routes import playlist, rating, songs, auth, genre, artist, album, search
-from .database import es
+from . import models, database, jobs, analysis, migrations, cache, media
+from .routes import playlist, rating, songs, auth, genre, artist, album, search, ingest, metrics
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+async def sweep_uploads():
+
+    """
+    Delete the abandoned resumable uploads and the media objects left without references
+    every UPLOAD_SWEEP_SECONDS, while the application runs.
+    """
+
+    while True:
+        try:
+            async with database.AsyncSessionLocal() as db:
+                expired = await media.expire_upload_sessions(db)
+                orphans = await media.sweep_orphans(db)
+            if expired:
+                logger.info("Deleted %s abandoned upload sessions", expired)
+            if orphans:
+                logger.info("Removed %s unreferenced media objects", orphans)
+        except Exception:
+            logger.exception("Sweeping the abandoned uploads failed")
+
+        await asyncio.sleep(media.UPLOAD_SWEEP_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+
+    """
+    Open the shared clients and prepare the storage when the application starts,
+    and release them when it stops.
+    """
+
+    # One async Elasticsearch client, and its connection pool, for every request
+    app.state.es = database.create_async_es()
+
+    # Let the background workers invalidate the catalog cache
+    cache.catalog.start()
+    sweeper = None
+
+    try:
+        # Elasticsearch index creation
+        for index_name in ["songs", "playlist"]:
+            if not await database.es_call(app.state.es.indices.exists, index=index_name):
+                await database.es_call(app.state.es.indices.create, index=index_name)
+
+        # Create database tables, then bring existing ones up to the current schema
+        async with database.async_engine.begin() as connection:
+            await connection.run_sync(models.Base.metadata.create_all)
+        await run_in_threadpool(migrations.upgrade, database.engine)
+
+        # Resume the ingest jobs interrupted by a restart
+        await run_in_threadpool(jobs.resume_pending)
+
+        # Clean up the resumable uploads clients gave up on
+        sweeper = asyncio.create_task(sweep_uploads())
+
+        yield
+    finally:
+        # Stop sweeping the abandoned uploads
+        if sweeper is not None:
+            sweeper.cancel()
+
+        # Stop the audio analysis workers and close the connections
+        analysis.shutdown()
+        await app.state.es.close()
+        await cache.catalog.close()
+        await database.async_engine.dispose()
+        for replica in database.replica_engines:
+            await replica.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "0.0.0.0"
@@ -29,85 +103,5 @@ app.include_router(auth.router)
 app.include_router(genre.router)
 app.include_router(artist.router)
 app.include_router(album.router)
-
-# Elasticsearch index creation
-index_names = ["songs", "playlist"]
-
-for index_name in index_names:
-    if not es.indices.exists(index=index_name):
-        es.indices.create(index=index_name)
-
-# Create database tables
-models.Base.metadata.create_all(database.engine)
-
-
-@app.post('/dump')
-async def dump_csv_file(file: UploadFile, db: database.db_dependency):
-
-    """
-    Endpoint to process and import data from a CSV file.
-
-    Parameters:
-        file (UploadFile): The CSV file to import.
-        db (Session): SQLAlchemy database session.
-
-    Raises:
-        HTTPException: If the file format is not CSV.
-
-    Returns:
-        HTTPException: Success message if data is added successfully.
-    """
-
-    # Check if the uploaded file is a CSV file
-    if file.content_type != 'text/csv':
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Please Upload a CSV file!")
-
-    # Read content from the CSV file
-    content = await file.read()
-    content_str = content.decode("utf-8")
-
-    # Parse CSV lines
-    csv_lines = csv.reader(content_str.splitlines())
-
-    # Process each row in the CSV file
-    for row in csv_lines:
-        # Check if artist exists or create a new one
-        artist = db.query(models.Artist).filter(models.Artist.artistName == row[1]).first()
-        if not artist:
-            artist = models.Artist(artistName=row[1])
-            db.add(artist)
-            db.commit()
-
-        # Check if genre exists or create a new one
-        genre = db.query(models.Genre).filter(models.Genre.genreName == row[3]).first()
-        if not genre:
-            genre = models.Genre(genreName=row[3])
-            db.add(genre)
-            db.commit()
-
-        # Check if album exists or create a new one
-        album = db.query(models.Album).filter(models.Album.albumName == row[2]).first()
-        if not album:
-            album = models.Album(albumName=row[2], artistId=artist.id)
-            db.add(album)
-            db.commit()
-
-        # Check if the song exists or create a new one
-        song_instance = db.query(models.Songs).filter(models.Songs.songName == row[0]).first()
-        if not song_instance:
-            song = models.Songs(songName=row[0], artistId=artist.id, genreId=genre.id, albumId=album.id)
-            db.add(song)
-            db.commit()
-
-        # Index the song data in Elasticsearch
-        document = {
-            "songId": song_instance.id,
-            "songName": row[0],
-            "artistName": row[1],
-            "genreName": row[3],
-            "albumName": row[2]
-        }
-        response = es.index(index="songs", body=document, id=song_instance.id)
-
-    # Return success message
-    return { "detail" : "The Data is Added Successfully!" } 
+app.include_router(ingest.router)
+app.include_router(metrics.router)
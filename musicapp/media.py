@@ -0,0 +1,529 @@
+import hashlib
+import os
+import re
+import shutil
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import anyio
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+
+# Directory where uploaded audio files are stored
+MEDIA_DIR = os.environ.get("MEDIA_DIR", "files")
+
+# Size of the pieces an upload is copied to disk in
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+# Size of the pieces a file is sent in when the server has no zero-copy support
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", 256 * 1024))
+
+# Largest accepted audio file, in bytes
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", 500 * 1024 * 1024))
+
+# Resumable uploads without a new chunk for this long are abandoned, and their partial files removed
+UPLOAD_SESSION_TTL_SECONDS = int(os.environ.get("UPLOAD_SESSION_TTL_SECONDS", 24 * 3600))
+
+# Seconds between two sweeps of the abandoned uploads
+UPLOAD_SWEEP_SECONDS = int(os.environ.get("UPLOAD_SWEEP_SECONDS", 3600))
+
+
+def check_audio(content_type: str | None, size: int | None):
+
+    """
+    Validate an audio upload from its headers, before any of it is read.
+
+    Parameters:
+        content_type (str | None): The Content-Type of the request.
+        size (int | None): The Content-Length of the request, None when it is sent chunked.
+
+    Raises:
+        HTTPException: If the file is not audio (HTTP 415),
+                       if the file is larger than MAX_UPLOAD_SIZE (HTTP 413).
+    """
+
+    if not (content_type or "").startswith("audio/"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Please upload an audio file!"
+        )
+
+    if size is not None and size > MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Audio files are limited to {MAX_UPLOAD_SIZE} bytes!"
+        )
+
+
+def check_declared_audio(content_type: str, size: int):
+
+    """
+    Validate the content type and size announced for a resumable upload.
+
+    Parameters:
+        content_type (str): The announced content type.
+        size (int): The announced size in bytes.
+
+    Raises:
+        HTTPException: If the file is not audio (HTTP 415),
+                       if the size is not between 1 and MAX_UPLOAD_SIZE bytes (HTTP 413).
+    """
+
+    if not content_type.startswith("audio/"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Please upload an audio file!"
+        )
+
+    if not 0 < size <= MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Audio files are limited to {MAX_UPLOAD_SIZE} bytes!"
+        )
+
+
+async def save_upload(stream, destination: str, max_size: int = MAX_UPLOAD_SIZE) -> tuple[int, str]:
+
+    """
+    Stream an upload to disk as it arrives without blocking the event loop.
+
+    Parameters:
+        stream: An async iterator of bytes, e.g. `Request.stream()`.
+        destination (str): The path to write the file to.
+        max_size (int): The largest accepted size in bytes.
+
+    Raises:
+        HTTPException: If the file grows past `max_size` (HTTP 413).
+
+    Returns:
+        tuple[int, str]: The number of bytes written and their SHA-256 digest.
+    """
+
+    size = 0
+    digest = hashlib.sha256()
+    handle = await run_in_threadpool(open, destination, "wb")
+
+    try:
+        async for chunk in stream:
+            # Stop as soon as the limit is crossed instead of after the whole file
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Audio files are limited to {max_size} bytes!"
+                )
+            digest.update(chunk)
+            await run_in_threadpool(handle.write, chunk)
+    except BaseException:
+        await run_in_threadpool(handle.close)
+        await run_in_threadpool(os.remove, destination)
+        raise
+
+    await run_in_threadpool(handle.close)
+    return size, digest.hexdigest()
+
+
+def temp_path() -> str:
+
+    """
+    Get a fresh path for an upload that hasn't been hashed yet.
+    """
+
+    directory = os.path.join(MEDIA_DIR, "tmp")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, str(uuid4()))
+
+
+def hash_file(path: str) -> str:
+
+    """
+    Compute the SHA-256 digest of a file, reading it in bounded chunks.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        while chunk := handle.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_path(digest: str) -> str:
+
+    """
+    Get the sharded location of a stored object, e.g. objects/ab/cd/abcd....
+
+    Two levels of 256 directories keep every directory small at millions of objects.
+    """
+
+    return os.path.join(MEDIA_DIR, "objects", digest[:2], digest[2:4], digest)
+
+
+def resolve(file_name: str) -> str:
+
+    """
+    Get the location of the audio file recorded on a song.
+
+    Songs uploaded before the content-addressed store keep their flat file name.
+    """
+
+    if re.fullmatch(r"[0-9a-f]{64}", file_name):
+        return object_path(file_name)
+    return os.path.join(MEDIA_DIR, file_name)
+
+
+async def store_object(db: AsyncSession, source: str, digest: str, size: int, content_type: str) -> str:
+
+    """
+    Add a hashed file to the content-addressed store, or reference the copy already stored.
+
+    The reference count is updated in the caller's transaction, so it is
+    committed together with the song that uses the object.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        source (str): The path of the hashed file, which is moved or removed.
+        digest (str): The SHA-256 digest of the file.
+        size (int): The size of the file in bytes.
+        content_type (str): The content type of the file.
+
+    Returns:
+        str: The key to record on the song.
+    """
+
+    # Reference the stored copy when the content is already known
+    if (await db.execute(
+        update(models.MediaObject)
+        .where(models.MediaObject.digest == digest)
+        .values(refCount=models.MediaObject.refCount + 1)
+    )).rowcount:
+        await run_in_threadpool(os.remove, source)
+        return digest
+
+    # Otherwise register the object, losing gracefully to a concurrent identical upload
+    try:
+        async with db.begin_nested():
+            db.add(models.MediaObject(digest=digest, size=size, contentType=content_type, refCount=1))
+    except IntegrityError:
+        await db.execute(
+            update(models.MediaObject)
+            .where(models.MediaObject.digest == digest)
+            .values(refCount=models.MediaObject.refCount + 1)
+        )
+
+    path = object_path(digest)
+    await run_in_threadpool(os.makedirs, os.path.dirname(path), exist_ok=True)
+    await run_in_threadpool(os.replace, source, path)
+
+    return digest
+
+
+async def release_object(db: AsyncSession, file_name: str | None) -> str | None:
+
+    """
+    Drop a song's reference to a stored object.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        file_name (str | None): The key recorded on the song.
+
+    Returns:
+        str | None: The object to pass to `remove_orphans` once the transaction commits, if this was the last reference.
+    """
+
+    if not file_name:
+        return None
+
+    stored = await db.scalar(
+        select(models.MediaObject).where(models.MediaObject.digest == file_name).with_for_update()
+    )
+    if not stored:
+        return None
+
+    stored.refCount -= 1
+    if stored.refCount > 0:
+        return None
+
+    # The row stays, without references, until its file is removed
+    return file_name
+
+
+async def remove_orphans(db: AsyncSession, digests: list[str | None]):
+
+    """
+    Remove the objects returned by `release_object`, once the transaction that released them committed.
+
+    Each object is locked and checked to still have no reference before its file and row go,
+    so that an upload of the same content meanwhile keeps it. An upload waiting on the lock
+    finds no row afterwards and stores the file again.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        digests (list[str | None]): The objects released.
+    """
+
+    for digest in digests:
+        if not digest:
+            continue
+
+        stored = await db.scalar(
+            select(models.MediaObject)
+            .where(models.MediaObject.digest == digest, models.MediaObject.refCount <= 0)
+            .with_for_update()
+        )
+
+        # Referenced again, or removed by another request or the sweeper
+        if not stored:
+            await db.commit()
+            continue
+
+        path = object_path(digest)
+        if os.path.exists(path):
+            await run_in_threadpool(os.remove, path)
+
+        await db.delete(stored)
+        await db.commit()
+
+
+async def sweep_orphans(db: AsyncSession) -> int:
+
+    """
+    Remove the objects left without references by a request that stopped before removing them.
+
+    Parameters:
+        db (AsyncSession): The database session.
+
+    Returns:
+        int: The number of objects found without references.
+    """
+
+    digests = (await db.scalars(
+        select(models.MediaObject.digest).where(models.MediaObject.refCount <= 0)
+    )).all()
+    await db.commit()
+
+    await remove_orphans(db, digests)
+    return len(digests)
+
+
+def partial_path(session_id: str) -> str:
+
+    """
+    Get the path of the partial file of a resumable upload.
+    """
+
+    return os.path.join(MEDIA_DIR, "uploads", f"{session_id}.part")
+
+
+def create_partial(session_id: str):
+
+    """
+    Create the empty partial file of a resumable upload.
+    """
+
+    path = partial_path(session_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+async def expire_upload_sessions(db: AsyncSession) -> int:
+
+    """
+    Delete the resumable uploads that received no chunk for UPLOAD_SESSION_TTL_SECONDS, and their partial files.
+
+    Parameters:
+        db (AsyncSession): The database session.
+
+    Returns:
+        int: The number of upload sessions deleted.
+    """
+
+    expired = datetime.utcnow() - timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS)
+
+    # Sessions receiving a chunk meanwhile are no longer matched
+    session_ids = (await db.scalars(
+        delete(models.UploadSession)
+        .where(models.UploadSession.updatedAt < expired)
+        .returning(models.UploadSession.id)
+    )).all()
+    await db.commit()
+
+    for session_id in session_ids:
+        path = partial_path(session_id)
+        if os.path.exists(path):
+            await run_in_threadpool(os.remove, path)
+
+    return len(session_ids)
+
+
+async def save_chunk(stream, destination: str, offset: int, max_size: int) -> int:
+
+    """
+    Stream a chunk of a resumable upload to a file of its own, without holding the upload session.
+
+    Parameters:
+        stream: An async iterator of bytes, e.g. `Request.stream()`.
+        destination (str): The path to write the chunk to.
+        offset (int): The number of bytes of the upload already acknowledged.
+        max_size (int): The size the upload may not grow past.
+
+    Raises:
+        HTTPException: If the upload grows past `max_size` (HTTP 413).
+
+    Returns:
+        int: The number of bytes written.
+    """
+
+    size = offset
+    handle = await run_in_threadpool(open, destination, "wb")
+
+    try:
+        async for chunk in stream:
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"The upload is limited to {max_size} bytes!"
+                )
+            await run_in_threadpool(handle.write, chunk)
+    except BaseException:
+        await run_in_threadpool(handle.close)
+        await run_in_threadpool(os.remove, destination)
+        raise
+
+    await run_in_threadpool(handle.close)
+    return size - offset
+
+
+def append_chunk(source: str, destination: str, offset: int):
+
+    """
+    Append a received chunk to the partial file of its upload, after the last acknowledged byte.
+
+    Anything past `offset` is cut first, so an earlier attempt that failed
+    halfway through the chunk leaves no trace.
+
+    Parameters:
+        source (str): The path of the chunk, written by `save_chunk`.
+        destination (str): The path of the partial file.
+        offset (int): The number of bytes already acknowledged.
+    """
+
+    with open(destination, "r+b") as handle, open(source, "rb") as chunk:
+        handle.truncate(offset)
+        handle.seek(offset)
+        shutil.copyfileobj(chunk, handle, UPLOAD_CHUNK_SIZE)
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+
+    """
+    Parse a single-range HTTP Range header.
+
+    Parameters:
+        header (str): The value of the Range header.
+        size (int): The size of the file in bytes.
+
+    Raises:
+        HTTPException: If the range can't be satisfied (HTTP 416).
+
+    Returns:
+        tuple[int, int] | None: The first and last byte to send, or None to send the whole file.
+    """
+
+    # Multiple or unknown ranges fall back to the whole file
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header)
+    if not match or not any(match.groups()):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # A suffix range asks for the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested Range Not Satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+
+    return start, end
+
+
+class RangeFileResponse(Response):
+
+    """
+    File response that honours HTTP Range requests.
+
+    The body is handed to the server with the `http.response.zerocopysend`
+    ASGI extension when it is available, so the bytes go out through sendfile
+    without passing through Python. Other servers get bounded chunks.
+    """
+
+    def __init__(self, path: str, media_type: str | None = None, range_header: str | None = None):
+        size = os.stat(path).st_size
+        byte_range = parse_range(range_header, size) if range_header else None
+
+        self.path = path
+        self.start, end = byte_range or (0, size - 1)
+        self.count = end - self.start + 1 if size else 0
+
+        headers = {
+            "accept-ranges": "bytes",
+            "content-length": str(self.count)
+        }
+        if byte_range:
+            headers["content-range"] = f"bytes {self.start}-{end}/{size}"
+
+        super().__init__(
+            status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+            headers=headers,
+            media_type=media_type or "application/octet-stream"
+        )
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+
+        if scope["method"] == "HEAD" or not self.count:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        # Let the server send the file with sendfile when it supports it
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as handle:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": handle,
+                    "offset": self.start,
+                    "count": self.count,
+                    "more_body": False
+                })
+            return
+
+        # Otherwise read the range in bounded chunks
+        async with await anyio.open_file(self.path, "rb") as handle:
+            await handle.seek(self.start)
+            remaining = self.count
+            while remaining:
+                chunk = await handle.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+            if remaining:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
@@ -0,0 +1,208 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, delete, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from . import models, ratings
+
+logger = logging.getLogger(__name__)
+
+# Key of the PostgreSQL advisory lock held while migrating, so that workers starting together migrate once
+MIGRATION_LOCK = 0x6D75736963
+
+
+def add_missing_columns(connection: Connection, table, names: list[str]):
+
+    """
+    Add the columns of a model that an older table was created without.
+    """
+
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    preparer = connection.dialect.identifier_preparer
+
+    for name in names:
+        if name in existing:
+            continue
+        column: Column = table.columns[name]
+        default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ""
+        connection.execute(text(
+            f"ALTER TABLE {preparer.format_table(table)} "
+            f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(connection.dialect)}{default}"
+        ))
+
+
+def create_indexes(connection: Connection, table, names: list[str]):
+
+    """
+    Create the named indexes declared on a model, skipping those that already exist.
+    """
+
+    indexes = {index.name: index for index in table.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+
+def find_duplicates(connection: Connection, table, columns: list[str]) -> list[tuple]:
+
+    """
+    Find a few of the values shared by several rows, which a unique index over the columns would reject.
+    """
+
+    keys = [table.columns[name] for name in columns]
+    duplicates = connection.execute(
+        select(*keys, func.count())
+        .group_by(*keys)
+        .having(func.count() > 1)
+        .limit(5)
+    ).all()
+
+    return [tuple(row) for row in duplicates]
+
+
+def add_song_media_columns(connection: Connection):
+
+    # Songs created before uploads were stored and analysed lack these columns
+    add_missing_columns(
+        connection,
+        models.Songs.__table__,
+        ["fileName", "contentType", "duration", "sampleRate", "bitrate", "channels"]
+    )
+
+
+def dedupe_associations(connection: Connection):
+
+    # A user keeps their first rating of a song, as rating it again does
+    rating = models.Rating.__table__
+    earliest = select(func.min(rating.c.id)).group_by(rating.c.byUserId, rating.c.songId)
+    connection.execute(delete(rating).where(rating.c.id.not_in(earliest)))
+
+    # A song appears once in a playlist
+    entries = models.PlaylistSong.__table__
+    first = select(func.min(entries.c.id)).group_by(entries.c.playlistId, entries.c.songId)
+    connection.execute(delete(entries).where(entries.c.id.not_in(first)))
+
+    create_indexes(connection, rating, ["ix_rating_byUserId_songId", "ix_rating_songId"])
+    create_indexes(connection, entries, ["ix_playlistSong_playlistId_songId"])
+
+
+def add_lookup_indexes(connection: Connection):
+
+    # Names looked up without being unique on their own
+    create_indexes(connection, models.Playlist.__table__, ["ix_playlists_playlistName"])
+    create_indexes(connection, models.Album.__table__, ["ix_album_albumName"])
+
+
+def add_natural_keys(connection: Connection):
+
+    # The catalog and the users are looked up, and kept unique, by name.
+    # Keys over rows that already share a name are skipped, not to block startup,
+    # and retried by every upgrade until the duplicates are merged or renamed.
+    for table, columns, name in NATURAL_KEYS:
+        if name in {index["name"] for index in inspect(connection).get_indexes(table.name)}:
+            continue
+
+        duplicates = find_duplicates(connection, table, columns)
+        if duplicates:
+            logger.warning(
+                "Skipping the unique index %s: merge or rename the duplicates of %s(%s) first: %s",
+                name, table.name, ", ".join(columns), duplicates
+            )
+            continue
+
+        create_indexes(connection, table, [name])
+
+
+def add_rating_aggregates(connection: Connection):
+
+    # Songs carry the running sum and count of their ratings, seeded from the existing ratings
+    add_missing_columns(connection, models.Songs.__table__, ["ratingSum", "ratingCount"])
+    connection.execute(ratings.recompute())
+
+
+def add_playlist_versions(connection: Connection):
+
+    # Playlists count their changes, for the ETags of their responses
+    add_missing_columns(connection, models.Playlist.__table__, ["version"])
+
+
+# The unique indexes added by migration 4
+NATURAL_KEYS = [
+    (models.Users.__table__, ["username"], "ix_users_username"),
+    (models.Artist.__table__, ["artistName"], "ix_artist_artistName"),
+    (models.Genre.__table__, ["genreName"], "ix_genre_genreName"),
+    (models.Songs.__table__, ["songName"], "ix_songs_songName"),
+    (models.Album.__table__, ["artistId", "albumName"], "ix_album_artistId_albumName"),
+    (models.Playlist.__table__, ["userId", "playlistName"], "ix_playlists_userId_playlistName")
+]
+
+# Applied in order, each in its own transaction; append new migrations, never reorder them
+MIGRATIONS = [
+    (1, "song media columns", add_song_media_columns),
+    (2, "unique ratings and playlist entries", dedupe_associations),
+    (3, "lookup indexes", add_lookup_indexes),
+    (4, "natural keys", add_natural_keys),
+    (5, "rating aggregates", add_rating_aggregates),
+    (6, "playlist versions", add_playlist_versions)
+]
+
+
+def current_version(connection: Connection) -> int:
+
+    """
+    Get the number of the last applied migration, 0 for a database that was never migrated.
+    """
+
+    return connection.execute(select(func.max(models.SchemaVersion.version))).scalar() or 0
+
+
+def upgrade(engine: Engine) -> list[int]:
+
+    """
+    Apply the migrations the database hasn't seen yet.
+
+    Migrations are idempotent, so a database created by `create_all` with the
+    current models only records them as applied.
+
+    Parameters:
+        engine (Engine): The engine of the database to migrate.
+
+    Raises:
+        RuntimeError: If a migration can't be applied; the migrations before it stay applied.
+
+    Returns:
+        list[int]: The versions applied by this call.
+    """
+
+    models.SchemaVersion.__table__.create(engine, checkfirst=True)
+    applied = []
+
+    with engine.connect() as lock:
+        if engine.dialect.name == "postgresql":
+            lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK})
+
+        try:
+            for version, name, migrate in MIGRATIONS:
+                with engine.begin() as connection:
+                    if version <= current_version(connection):
+                        continue
+
+                    logger.info("Applying migration %s: %s", version, name)
+                    migrate(connection)
+                    connection.execute(
+                        models.SchemaVersion.__table__.insert().values(
+                            version=version, name=name, appliedAt=datetime.utcnow()
+                        )
+                    )
+                    applied.append(version)
+
+            # Retry the natural keys skipped over duplicates
+            if 4 not in applied:
+                with engine.begin() as connection:
+                    add_natural_keys(connection)
+        finally:
+            if engine.dialect.name == "postgresql":
+                lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK})
+                lock.commit()
+
+    return applied
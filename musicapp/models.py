@@ -1,14 +1,25 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, JSON, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 
 
 class Songs(Base):
     __tablename__ = "songs"
+    __table_args__ = (
+        Index("ix_songs_songName", "songName", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     songName = Column(String)
-    # fileName = Column(String, default=None)
+    fileName = Column(String, default=None) # digest of the stored media object
+    contentType = Column(String, default=None)
+    duration = Column(Float, default=None) # seconds
+    sampleRate = Column(Integer, default=None)
+    bitrate = Column(Integer, default=None) # bits per second
+    channels = Column(Integer, default=None)
+    ratingSum = Column(Float, default=0, server_default="0") # running sum of the song's ratings
+    ratingCount = Column(Integer, default=0, server_default="0")
     artistId = Column(Integer, ForeignKey("artist.id", ondelete="CASCADE"))
     genreId = Column(Integer, ForeignKey("genre.id"))
     albumId = Column(Integer, ForeignKey("album.id", ondelete="CASCADE"))
@@ -18,10 +29,14 @@ class Songs(Base):
     album = relationship("Album", back_populates="songs")
     playlistSong = relationship("PlaylistSong", back_populates="songs")
     rating = relationship("Rating", back_populates="songs")
+    waveform = relationship("SongWaveform", back_populates="songs", cascade="all, delete")
     
 
 class Users(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_username", "username", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String)
@@ -34,10 +49,15 @@ class Users(Base):
 
 class Playlist(Base):
     __tablename__ = "playlists"
+    __table_args__ = (
+        Index("ix_playlists_playlistName", "playlistName"),
+        Index("ix_playlists_userId_playlistName", "userId", "playlistName", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     playlistName = Column(String)
     userId = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    version = Column(Integer, default=0, server_default="0") # bumped whenever the playlist's songs or their details change
 
     playlistSong = relationship("PlaylistSong", back_populates="playlists", cascade="all, delete")
     users = relationship("Users", back_populates="playlists")
@@ -45,6 +65,9 @@ class Playlist(Base):
 
 class PlaylistSong(Base):
     __tablename__ = "playlistSong"
+    __table_args__ = (
+        Index("ix_playlistSong_playlistId_songId", "playlistId", "songId", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     playlistId = Column(Integer, ForeignKey("playlists.id", ondelete="CASCADE"))
@@ -56,6 +79,9 @@ class PlaylistSong(Base):
 
 class Artist(Base):
     __tablename__ = "artist"
+    __table_args__ = (
+        Index("ix_artist_artistName", "artistName", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     artistName = Column(String)
@@ -66,6 +92,9 @@ class Artist(Base):
 
 class Genre(Base):
     __tablename__ = "genre"
+    __table_args__ = (
+        Index("ix_genre_genreName", "genreName", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     genreName = Column(String)
@@ -75,6 +104,10 @@ class Genre(Base):
 
 class Album(Base):
     __tablename__ = "album"
+    __table_args__ = (
+        Index("ix_album_albumName", "albumName"),
+        Index("ix_album_artistId_albumName", "artistId", "albumName", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     albumName = Column(String)
@@ -86,6 +119,10 @@ class Album(Base):
 
 class Rating(Base):
     __tablename__ = "rating"
+    __table_args__ = (
+        Index("ix_rating_byUserId_songId", "byUserId", "songId", unique=True),
+        Index("ix_rating_songId", "songId"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     rating = Column(Float, default=0) 
@@ -103,4 +140,70 @@ class Suggestion(Base):
     byUserId = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     toUserId = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     typeOfSuggestion = Column(String)
-    suggestedItem = Column(String)
\ No newline at end of file
+    suggestedItem = Column(String)
+
+
+class IngestJob(Base):
+    __tablename__ = "ingestJob"
+
+    id = Column(String, primary_key=True, index=True)
+    status = Column(String, default="queued") # queued, running, completed, failed
+    source = Column(String)
+    rowsProcessed = Column(Integer, default=0) # rows covered by committed batches
+    resumedFrom = Column(Integer, default=0)
+    songsCreated = Column(Integer, default=0)
+    indexed = Column(Integer, default=0)
+    indexFailed = Column(Integer, default=0)
+    errors = Column(JSON, default=list)
+    createdAt = Column(DateTime, default=datetime.utcnow)
+    startedAt = Column(DateTime, default=None)
+    updatedAt = Column(DateTime, default=datetime.utcnow)
+    finishedAt = Column(DateTime, default=None)
+
+
+class SongWaveform(Base):
+    __tablename__ = "songWaveform"
+
+    id = Column(Integer, primary_key=True, index=True)
+    songId = Column(Integer, ForeignKey("songs.id", ondelete="CASCADE"), index=True)
+    level = Column(Integer) # 0 is the most detailed
+    samplesPerPeak = Column(Integer)
+    sampleRate = Column(Integer)
+    peaks = Column(LargeBinary) # int8 (min, max) pairs
+
+    songs = relationship("Songs", back_populates="waveform")
+
+
+class MediaObject(Base):
+    __tablename__ = "mediaObject"
+
+    digest = Column(String, primary_key=True, index=True) # SHA-256 of the content
+    size = Column(Integer)
+    contentType = Column(String)
+    refCount = Column(Integer, default=0)
+    createdAt = Column(DateTime, default=datetime.utcnow)
+
+
+class UploadSession(Base):
+    __tablename__ = "uploadSession"
+
+    id = Column(String, primary_key=True, index=True)
+    userId = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    songName = Column(String)
+    genreId = Column(Integer)
+    artistId = Column(Integer)
+    albumId = Column(Integer)
+    contentType = Column(String)
+    totalSize = Column(Integer)
+    receivedBytes = Column(Integer, default=0)
+    nextChunk = Column(Integer, default=0)
+    createdAt = Column(DateTime, default=datetime.utcnow)
+    updatedAt = Column(DateTime, default=datetime.utcnow)
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schemaVersion"
+
+    version = Column(Integer, primary_key=True) # number of the applied migration
+    name = Column(String)
+    appliedAt = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,78 @@
+import os
+from typing import Annotated, Callable
+
+from fastapi import Depends, Query
+from sqlalchemy.sql import Select
+
+# Items a page holds when the client doesn't ask for a size, and the most it may ask for
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 200))
+
+
+class PageParams:
+
+    """
+    The page a client asks for: the items whose key comes after the `after`
+    cursor, at most `limit` of them.
+    """
+
+    def __init__(
+        self,
+        after: Annotated[int | None, Query(description="The nextCursor of the previous page")] = None,
+        limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = PAGE_SIZE
+    ):
+        self.after = after
+        self.limit = limit
+
+    def __str__(self) -> str:
+        return f"after={self.after}&limit={self.limit}"
+
+
+page_dependency = Annotated[PageParams, Depends()]
+
+# The first page, for responses embedding the start of a list
+FIRST_PAGE = PageParams()
+
+
+def keyset(query: Select, key, page: PageParams) -> Select:
+
+    """
+    Restrict a query to one page, ordered by a unique key.
+
+    Unlike OFFSET, the database seeks straight to the cursor through the key's
+    index, and rows added or removed before the cursor don't shift the page.
+    One row more than the page is selected, to tell whether another page follows.
+
+    Parameters:
+        query (Select): The query of every item.
+        key: The unique, indexed column ordering the items, e.g. `models.Songs.id`.
+        page (PageParams): The page to select.
+
+    Returns:
+        Select: The query of the page.
+    """
+
+    if page.after is not None:
+        query = query.where(key > page.after)
+
+    return query.order_by(key).limit(page.limit + 1)
+
+
+def page_of(rows: list, page: PageParams, cursor: Callable = lambda row: row.id) -> dict:
+
+    """
+    Build a page from the rows selected by `keyset`.
+
+    Parameters:
+        rows (list): The rows of the page, plus possibly the first row of the next one.
+        page (PageParams): The page that was selected.
+        cursor (Callable): Gets the key of a row.
+
+    Returns:
+        dict: The `items` of the page, and the `nextCursor` to pass as `after`, None on the last page.
+    """
+
+    items = list(rows[:page.limit])
+    more = len(rows) > page.limit
+
+    return {"items": items, "nextCursor": cursor(items[-1]) if more else None}
@@ -0,0 +1,196 @@
+from collections import defaultdict
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from . import models
+
+RATING_COLUMNS = ["rating", "byUserId", "songId"]
+
+
+def adjust(song_id: int, delta: float, count: int):
+
+    """
+    Build the UPDATE that moves a song's rating aggregates.
+
+    The new values are computed by the database from the stored ones, so
+    concurrent ratings of the same song never overwrite each other.
+
+    Parameters:
+        song_id (int): The ID of the song.
+        delta (float): The change of the rating sum.
+        count (int): The change of the rating count, -1, 0 or 1.
+
+    Returns:
+        Update: The statement to execute in the transaction writing the rating.
+    """
+
+    return (
+        update(models.Songs)
+        .where(models.Songs.id == song_id)
+        .values(
+            ratingSum=models.Songs.ratingSum + delta,
+            ratingCount=models.Songs.ratingCount + count
+        )
+    )
+
+
+def recompute(song_ids: list[int] | None = None):
+
+    """
+    Build the UPDATE that recomputes rating aggregates from the rating table.
+
+    Parameters:
+        song_ids (list[int] | None): The songs to repair, every song when None.
+
+    Returns:
+        Update: The statement to execute.
+    """
+
+    ratings = models.Rating
+    total = (
+        select(func.coalesce(func.sum(ratings.rating), 0))
+        .where(ratings.songId == models.Songs.id)
+        .scalar_subquery()
+    )
+    count = (
+        select(func.count(ratings.id))
+        .where(ratings.songId == models.Songs.id)
+        .scalar_subquery()
+    )
+
+    statement = update(models.Songs).values(ratingSum=total, ratingCount=count)
+    if song_ids is not None:
+        statement = statement.where(models.Songs.id.in_(song_ids))
+
+    return statement.execution_options(synchronize_session=False)
+
+
+def insert_new(dialect: str, source: Select | list[dict]):
+
+    """
+    Build the INSERT of ratings that skips, instead of failing on, ratings a user already gave.
+
+    Parameters:
+        dialect (str): The name of the database dialect.
+        source (Select | list[dict]): A SELECT of (rating, byUserId, songId), or the rows themselves.
+
+    Returns:
+        Insert: The statement, RETURNING the songId and rating of the inserted rows where supported.
+    """
+
+    if dialect == "postgresql":
+        statement = postgresql.insert(models.Rating)
+    elif dialect == "sqlite":
+        statement = sqlite.insert(models.Rating)
+    else:
+        statement = insert(models.Rating).prefix_with("IGNORE")
+
+    if isinstance(source, Select):
+        statement = statement.from_select(RATING_COLUMNS, source)
+    else:
+        statement = statement.values(source)
+
+    if dialect not in ("postgresql", "sqlite"):
+        return statement
+
+    return (
+        statement
+        .on_conflict_do_nothing(index_elements=["byUserId", "songId"])
+        .returning(models.Rating.songId, models.Rating.rating)
+    )
+
+
+def insert_and_count(source: Select | list[dict]):
+
+    """
+    Build a single PostgreSQL statement inserting new ratings and adding them to
+    their songs' aggregates, selecting the number of ratings inserted.
+    """
+
+    inserted = insert_new("postgresql", source).cte("inserted")
+    totals = (
+        select(
+            inserted.c.songId,
+            func.sum(inserted.c.rating).label("total"),
+            func.count().label("count")
+        )
+        .group_by(inserted.c.songId)
+        .cte("totals")
+    )
+    songs = models.Songs.__table__
+    updated = (
+        update(songs)
+        .where(songs.c.id == totals.c.songId)
+        .values(ratingSum=songs.c.ratingSum + totals.c.total, ratingCount=songs.c.ratingCount + totals.c["count"])
+        .returning(songs.c.id)
+        .cte("updated")
+    )
+
+    return select(func.coalesce(func.sum(totals.c["count"]), 0)).add_cte(updated)
+
+
+async def insert_ratings(db: AsyncSession, source: Select | list[dict], song_ids: list[int] | None = None) -> int:
+
+    """
+    Insert ratings, skipping those a user already gave, and add the new ones to
+    their songs' aggregates in the same transaction.
+
+    On PostgreSQL this is one statement; elsewhere the aggregates are moved by
+    a second one. The caller commits.
+
+    Parameters:
+        db (AsyncSession): The session of the transaction.
+        source (Select | list[dict]): A SELECT of (rating, byUserId, songId), or the rows themselves.
+        song_ids (list[int] | None): The songs a SELECT may rate, whose aggregates are recomputed
+                                     where the inserted rows are unknown; every song when None.
+
+    Returns:
+        int: The number of ratings inserted.
+    """
+
+    dialect = db.bind.dialect.name
+
+    if dialect == "postgresql":
+        return await db.scalar(insert_and_count(source))
+
+    if dialect != "sqlite":
+        # Without RETURNING the inserted rows are unknown, recompute the songs they may belong to
+        inserted = (await db.execute(insert_new(dialect, source))).rowcount
+        if inserted:
+            if not isinstance(source, Select):
+                song_ids = list({row["songId"] for row in source})
+            await db.execute(recompute(song_ids))
+        return inserted
+
+    # Sum the inserted ratings per song, then move every song's aggregates with one executemany
+    totals = defaultdict(lambda: [0.0, 0])
+    for song_id, rating in (await db.execute(insert_new(dialect, source))).all():
+        totals[song_id][0] += rating
+        totals[song_id][1] += 1
+
+    if totals:
+        songs = models.Songs.__table__
+        await db.execute(
+            update(songs)
+            .where(songs.c.id == bindparam("songId"))
+            .values(
+                ratingSum=songs.c.ratingSum + bindparam("total"),
+                ratingCount=songs.c.ratingCount + bindparam("count")
+            ),
+            [{"songId": song_id, "total": total, "count": count} for song_id, (total, count) in totals.items()]
+        )
+
+    return sum(count for _, count in totals.values())
+
+
+def average(total: float | None, count: int | None) -> float:
+
+    """
+    Get the average rating from a song's aggregates, 0 for an unrated song.
+    """
+
+    return total / count if count else 0
+
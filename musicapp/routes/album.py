@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException, status
-from .. import database, models, schemas
+from typing import Annotated
+from fastapi import APIRouter, HTTPException, status, Header
+from sqlalchemy import select
+from .. import database, models, schemas, loaders, cache, pagination, serialization
 from .auth import user_dep
 
 
@@ -10,42 +12,87 @@ router = APIRouter(
 
 
 @router.get('/info/{albumId}', response_model=schemas.AlbumInfo)
-def get_album(
-    db: database.db_dependency,
-    albumId: int
+async def get_album(
+    albumId: int,
+    if_none_match: Annotated[str | None, Header()] = None
 ):
     
     """
-    Get information about a specific album.
+    Get information about a specific album with the first page of its songs, from the catalog cache when possible.
 
     Parameters:
-    - db (Session): Database session dependency.
     - albumId (int): ID of the album to retrieve information for.
+    - if_none_match (str | None): The ETag of the response the client already has.
 
     Raises:
     - HTTPException: Raised with 404 status if the album is not found.
 
     Returns:
-    - AlbumInfo: Information about the album.
+    - AlbumInfo: Information about the album, or an empty 304 response if it hasn't changed.
     """
 
-    # Retrieve the album by ID
-    album = db.query(models.Album).filter(models.Album.id == albumId).first()
+    async def load(db):
+        # Retrieve the album by ID
+        album = (await db.execute(
+            select(models.Album.id, models.Album.albumName).where(models.Album.id == albumId)
+        )).first()
 
-    # Check if the album exists
-    if not album:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, 
-            detail="Album Not Found"
-        )
+        # Check if the album exists
+        if not album:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, 
+                detail="Album Not Found"
+            )
+
+        # Load the first page of its songs with everything the response shows
+        songs = await loaders.song_page(db, models.Songs.albumId == albumId, pagination.FIRST_PAGE)
+
+        return serialization.dump_json(schemas.AlbumInfo, {**album._mapping, "songs": songs})
 
     # Return album information
-    return album
+    return await cache.catalog.fetch(cache.ALBUMS, albumId, load, if_none_match)
+
+
+@router.get('/info/{albumId}/songs', response_model=schemas.Page[schemas.ShowSong])
+async def get_album_songs(
+    albumId: int,
+    page: pagination.page_dependency,
+    if_none_match: Annotated[str | None, Header()] = None
+):
+
+    """
+    Get a page of the songs of an album, from the catalog cache when possible.
+
+    Parameters:
+    - albumId (int): ID of the album.
+    - page (PageParams): The `after` cursor and `limit` of the page.
+    - if_none_match (str | None): The ETag of the response the client already has.
+
+    Raises:
+    - HTTPException: Raised with 404 status if the album is not found.
+
+    Returns:
+    - Page[ShowSong]: The songs after the cursor and the cursor of the next page.
+    """
+
+    async def load(db):
+        songs = await loaders.song_page(db, models.Songs.albumId == albumId, page)
+
+        # An empty page may also mean that the album doesn't exist
+        if not songs["items"] and not await db.scalar(select(models.Album.id).where(models.Album.id == albumId)):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, 
+                detail="Album Not Found"
+            )
+
+        return serialization.dump_json(schemas.Page[schemas.ShowSong], songs)
+
+    return await cache.catalog.fetch(cache.ALBUMS, f"{albumId}/songs?{page}", load, if_none_match)
 
 
 @router.post('/create')
-def create_album(
-    db: database.db_dependency,
+async def create_album(
+    db: database.async_db_dependency,
     user: user_dep,
     request : schemas.PostAlbum
 ):
@@ -54,7 +101,7 @@ def create_album(
     Create a new album for a specific artist. Only admins are allowed to perform this operation.
 
     Parameters:
-    - db (Session): Database session dependency.
+    - db (AsyncSession): Database session dependency.
     - albumName (str): Name of the new album.
     - artistId (int): ID of the artist for whom the album is created.
     - user (dict): User information obtained from the dependency.
@@ -74,10 +121,12 @@ def create_album(
         )
 
     # Check if the album with the given name and artist ID already exists
-    existing_album = db.query(models.Album).filter(
-        models.Album.albumName == request.albumName,
-        models.Album.artistId == request.artistId
-    ).first()
+    existing_album = await db.scalar(
+        select(models.Album).where(
+            models.Album.albumName == request.albumName,
+            models.Album.artistId == request.artistId
+        )
+    )
 
     if existing_album:
         raise HTTPException(
@@ -90,16 +139,17 @@ def create_album(
 
     # Add the new album to the database
     db.add(album)
-    db.commit()
-    db.refresh(album)
+    await db.commit()
+    await cache.catalog.invalidate(cache.ARTISTS)
+    await db.refresh(album)
 
     # Return success message
     return {"detail": "Album Created Successfully"}
 
 
 @router.put('/update')
-def update_album(
-    db: database.db_dependency,
+async def update_album(
+    db: database.async_db_dependency,
     user: user_dep,
     request : schemas.EditAlbum
 ):
@@ -108,7 +158,7 @@ def update_album(
     Update the name of a specific album. Only admins are allowed to perform this operation.
 
     Parameters:
-    - db (Session): Database session dependency.
+    - db (AsyncSession): Database session dependency.
     - name (str): New name for the album.
     - albumId (int): ID of the album to be updated.
     - user (dict): User information obtained from the dependency.
@@ -128,7 +178,7 @@ def update_album(
         )
 
     # Retrieve the album by ID
-    album = db.query(models.Album).filter(models.Album.id == request.albumId).first()
+    album = await db.scalar(select(models.Album).where(models.Album.id == request.albumId))
 
     # Check if the album exists
     if not album:
@@ -137,18 +187,35 @@ def update_album(
             detail="Album Not Found"
         )
 
+    # Check if another album of the artist already has the new name
+    existing_album = await db.scalar(
+        select(models.Album).where(
+            models.Album.albumName == request.name,
+            models.Album.artistId == album.artistId,
+            models.Album.id != album.id
+        )
+    )
+
+    if existing_album:
+        raise HTTPException(
+            status_code=status.HTTP_302_FOUND, 
+            detail="Album Already Exists"
+        )
+
     # Update the album name
     album.albumName = request.name
-    db.commit()
-    db.refresh(album)
+    await db.execute(loaders.touch_playlists(models.Songs.albumId == album.id))
+    await db.commit()
+    await cache.catalog.invalidate(cache.SONGS, cache.ALBUMS, cache.ARTISTS)
+    await db.refresh(album)
 
     # Return success message
     return {"detail": "Album Updated Successfully"}
 
 
 @router.delete('/delete/{albumId}')
-def delete_album(
-    db: database.db_dependency,
+async def delete_album(
+    db: database.async_db_dependency,
     albumId: int,
     user: user_dep
 ):
@@ -157,7 +224,7 @@ def delete_album(
     Delete a specific album. Only admins are allowed to perform this operation.
 
     Parameters:
-    - db (Session): Database session dependency.
+    - db (AsyncSession): Database session dependency.
     - albumId (int): ID of the album to be deleted.
     - user (dict): User information obtained from the dependency.
 
@@ -176,7 +243,7 @@ def delete_album(
         )
 
     # Retrieve the album by ID
-    album = db.query(models.Album).filter(models.Album.id == albumId).first()
+    album = await db.scalar(select(models.Album).where(models.Album.id == albumId))
 
     # Check if the album exists
     if not album:
@@ -185,9 +252,11 @@ def delete_album(
             detail="Album Not Found"
         )
 
-    # Delete the album
-    db.delete(album)
-    db.commit()
+    # Delete the album, its songs are kept without an album
+    await db.execute(loaders.touch_playlists(models.Songs.albumId == albumId))
+    await db.delete(album)
+    await db.commit()
+    await cache.catalog.invalidate(cache.SONGS, cache.ALBUMS, cache.ARTISTS)
 
     # Return success message
     return {"detail": "Album Deleted Successfully"}
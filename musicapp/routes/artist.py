@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException, status
-from .. import database, models, schemas
+from typing import Annotated
+from fastapi import APIRouter, HTTPException, status, Header
+from sqlalchemy import select
+from .. import database, models, schemas, loaders, cache, pagination, serialization, media
 from .auth import user_dep
 
 
@@ -10,42 +12,132 @@ router = APIRouter(
 
 
 @router.get('/info/{artistId}', response_model=schemas.ShowArtistDetails)
-def get_artist_info(
-        db: database.db_dependency, 
-        artistId: int
+async def get_artist_info(
+        artistId: int,
+        if_none_match: Annotated[str | None, Header()] = None
     ):
 
     """
-    Get information about a specific artist.
+    Get information about a specific artist with the first pages of its songs and albums,
+    from the catalog cache when possible.
 
     Parameters:
-    - db (Session): Database session dependency.
     - artistId (int): ID of the artist to retrieve information for.
+    - if_none_match (str | None): The ETag of the response the client already has.
 
     Raises:
     - HTTPException: Raised with 404 status if the artist is not found.
 
     Returns:
-    - ShowArtistDetails: Information about the artist.
+    - ShowArtistDetails: Information about the artist, or an empty 304 response if it hasn't changed.
     """
 
-    # Retrieve the artist by ID
-    artist = db.query(models.Artist).filter(models.Artist.id == artistId).first()
+    async def load(db):
+        # Retrieve the artist by ID
+        artist = (await db.execute(
+            select(models.Artist.id, models.Artist.artistName).where(models.Artist.id == artistId)
+        )).first()
+
+        # Check if the artist exists
+        if not artist:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, 
+                detail="Artist Not Found"
+            )
+
+        # Load the first pages of its songs, with everything the response shows, and of its albums
+        songs = await loaders.song_page(db, models.Songs.artistId == artistId, pagination.FIRST_PAGE)
+        albums = await loaders.album_page(db, artistId, pagination.FIRST_PAGE)
+
+        return serialization.dump_json(
+            schemas.ShowArtistDetails, {**artist._mapping, "songs": songs, "album": albums}
+        )
 
-    # Check if the artist exists
-    if not artist:
+    # Return artist information
+    return await cache.catalog.fetch(cache.ARTISTS, artistId, load, if_none_match)
+
+
+async def check_artist(db, artistId: int):
+
+    """
+    Raise a 404 if the artist doesn't exist, to tell an unknown artist from an empty page.
+    """
+
+    if not await db.scalar(select(models.Artist.id).where(models.Artist.id == artistId)):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="Artist Not Found"
         )
 
-    # Return artist information
-    return artist
+
+@router.get('/info/{artistId}/songs', response_model=schemas.Page[schemas.ShowSong])
+async def get_artist_songs(
+        artistId: int,
+        page: pagination.page_dependency,
+        if_none_match: Annotated[str | None, Header()] = None
+    ):
+
+    """
+    Get a page of the songs of an artist, from the catalog cache when possible.
+
+    Parameters:
+    - artistId (int): ID of the artist.
+    - page (PageParams): The `after` cursor and `limit` of the page.
+    - if_none_match (str | None): The ETag of the response the client already has.
+
+    Raises:
+    - HTTPException: Raised with 404 status if the artist is not found.
+
+    Returns:
+    - Page[ShowSong]: The songs after the cursor and the cursor of the next page.
+    """
+
+    async def load(db):
+        songs = await loaders.song_page(db, models.Songs.artistId == artistId, page)
+        if not songs["items"]:
+            await check_artist(db, artistId)
+
+        return serialization.dump_json(schemas.Page[schemas.ShowSong], songs)
+
+    return await cache.catalog.fetch(cache.ARTISTS, f"{artistId}/songs?{page}", load, if_none_match)
+
+
+@router.get('/info/{artistId}/albums', response_model=schemas.Page[schemas.Album])
+async def get_artist_albums(
+        artistId: int,
+        page: pagination.page_dependency,
+        if_none_match: Annotated[str | None, Header()] = None
+    ):
+
+    """
+    Get a page of the albums of an artist, from the catalog cache when possible.
+    Their songs are paged by GET /album/info/{albumId}/songs.
+
+    Parameters:
+    - artistId (int): ID of the artist.
+    - page (PageParams): The `after` cursor and `limit` of the page.
+    - if_none_match (str | None): The ETag of the response the client already has.
+
+    Raises:
+    - HTTPException: Raised with 404 status if the artist is not found.
+
+    Returns:
+    - Page[Album]: The albums after the cursor and the cursor of the next page.
+    """
+
+    async def load(db):
+        albums = await loaders.album_page(db, artistId, page)
+        if not albums["items"]:
+            await check_artist(db, artistId)
+
+        return serialization.dump_json(schemas.Page[schemas.Album], albums)
+
+    return await cache.catalog.fetch(cache.ARTISTS, f"{artistId}/albums?{page}", load, if_none_match)
 
 
 @router.post('/create')
-def create_artist(
-        db: database.db_dependency, 
+async def create_artist(
+        db: database.async_db_dependency, 
         request : schemas.PostArtist, 
         user: user_dep
     ):
@@ -54,7 +146,7 @@ def create_artist(
     Create a new artist. Only admins are allowed to perform this operation.
 
     Parameters:
-    - db (Session): Database session dependency.
+    - db (AsyncSession): Database session dependency.
     - artist (str): Name of the new artist.
     - user (dict): User information obtained from the dependency.
 
@@ -73,7 +165,7 @@ def create_artist(
         )
 
     # Check if the artist with the given name already exists
-    existing_artist = db.query(models.Artist).filter(models.Artist.artistName == request.artist).first()
+    existing_artist = await db.scalar(select(models.Artist).where(models.Artist.artistName == request.artist))
     if existing_artist:
         raise HTTPException(
             status_code=status.HTTP_302_FOUND, 
@@ -85,16 +177,16 @@ def create_artist(
 
     # Add the new artist to the database
     db.add(new_artist)
-    db.commit()
-    db.refresh(new_artist)
+    await db.commit()
+    await db.refresh(new_artist)
 
     # Return success message
     return {"detail": "Artist Created Successfully"}
 
 
 @router.put('/update')
-def update_artist(
-        db: database.db_dependency, 
+async def update_artist(
+        db: database.async_db_dependency, 
         request: schemas.EditArtist,
         user: user_dep
     ):
@@ -103,7 +195,7 @@ def update_artist(
     Update the name of a specific artist. Only admins are allowed to perform this operation.
 
     Parameters:
-    - db (Session): Database session dependency.
+    - db (AsyncSession): Database session dependency.
     - artistId (int): ID of the artist to be updated.
     - name (str): New name for the artist.
     - user (dict): User information obtained from the dependency.
@@ -123,7 +215,7 @@ def update_artist(
         )
 
     # Retrieve the artist by ID
-    artist = db.query(models.Artist).filter(models.Artist.id == request.artistId).first()
+    artist = await db.scalar(select(models.Artist).where(models.Artist.id == request.artistId))
 
     # Check if the artist exists
     if not artist:
@@ -133,10 +225,10 @@ def update_artist(
         )
     
     # Retrieve the artist by Name
-    artist = db.query(models.Artist).filter(models.Artist.artistName == request.name).first()
+    existing_artist = await db.scalar(select(models.Artist).where(models.Artist.artistName == request.name))
 
     # Check if the artist exists
-    if artist:
+    if existing_artist:
         raise HTTPException(
             status_code=status.HTTP_302_FOUND, 
             detail="Artist already Exists"
@@ -144,16 +236,18 @@ def update_artist(
 
     # Update the artist name
     artist.artistName = request.name
-    db.commit()
-    db.refresh(artist)
+    await db.execute(loaders.touch_playlists(models.Songs.artistId == artist.id))
+    await db.commit()
+    await cache.catalog.invalidate(cache.SONGS, cache.ALBUMS, cache.ARTISTS)
+    await db.refresh(artist)
 
     # Return success message
     return {"detail": "Artist Updated Successfully"}
 
 
 @router.delete('/delete/{artistId}')
-def delete_artist(
-        db: database.db_dependency, 
+async def delete_artist(
+        db: database.async_db_dependency, 
         artistId: int, 
         user: user_dep
     ):
@@ -162,7 +256,7 @@ def delete_artist(
     Delete a specific artist. Only admins are allowed to perform this operation.
 
     Parameters:
-    - db (Session): Database session dependency.
+    - db (AsyncSession): Database session dependency.
     - artistId (int): ID of the artist to be deleted.
     - user (dict): User information obtained from the dependency.
 
@@ -181,7 +275,7 @@ def delete_artist(
         )
 
     # Retrieve the artist by ID
-    artist = db.query(models.Artist).filter(models.Artist.id == artistId).first()
+    artist = await db.scalar(select(models.Artist).where(models.Artist.id == artistId))
 
     # Check if the artist exists
     if not artist:
@@ -190,9 +284,18 @@ def delete_artist(
             detail="Artist Id Not Found"
         )
 
-    # Delete the artist
-    db.delete(artist)
-    db.commit()
+    # Drop the references of the artist's songs to their audio files
+    songs = (await db.scalars(select(models.Songs).where(models.Songs.artistId == artistId))).all()
+    orphans = [await media.release_object(db, song.fileName) for song in songs]
+    await db.execute(loaders.touch_playlists(models.Songs.artistId == artistId))
+
+    # Delete the artist along with its albums and songs
+    await db.delete(artist)
+    await db.commit()
+    await cache.catalog.invalidate(cache.SONGS, cache.ALBUMS, cache.ARTISTS)
+
+    # Remove the audio files no song uses any more
+    await media.remove_orphans(db, orphans)
 
     # Return success message
     return {"detail": "Artist Deleted Successfully"}
@@ -4,8 +4,10 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import select
 
 from .. import schemas, models, database
 
@@ -71,7 +73,7 @@ user_dep = Annotated[dict, Depends(get_current_user)]
 @router.post('/token', response_model=schemas.Token, status_code=200)
 async def login_token(
         request: Annotated[OAuth2PasswordRequestForm, Depends()],
-        db: database.db_dependency
+        db: database.async_db_dependency
 ):
     
     """
@@ -79,14 +81,15 @@ async def login_token(
 
     Parameters:
     - request: OAuth2PasswordRequestForm, Form containing username and password.
-    - db: Session, Database session dependency.
+    - db: AsyncSession, Database session dependency.
 
     Returns:
     - dict: Access token and token type.
     """
 
-    user = db.query(models.Users).filter(models.Users.username == request.username).first()
-    if user and verify_password(user.passwordHash, request.password):
+    user = await db.scalar(select(models.Users).where(models.Users.username == request.username))
+    # bcrypt is deliberately slow, keep it off the event loop
+    if user and await run_in_threadpool(verify_password, user.passwordHash, request.password):
         token = create_access_token({"username": user.username, "id": user.id, "role": user.role})
         return {"access_token": token, "token_type": "bearer"}
     else:
@@ -94,25 +97,29 @@ async def login_token(
 
 
 @router.post('/signup', status_code=200, response_model=schemas.createUserResponse)
-def create_user(request: schemas.CreateUser, db: database.db_dependency):
+async def create_user(request: schemas.CreateUser, db: database.async_db_dependency):
 
     """
     Endpoint to create a new user.
 
     Parameters:
     - request: CreateUser, Request body containing user information.
-    - db: Session, Database session dependency.
+    - db: AsyncSession, Database session dependency.
 
     Returns:
     - Users: Newly created user.
     """
 
+    # Usernames are unique
+    if await db.scalar(select(models.Users).where(models.Users.username == request.username)):
+        raise HTTPException(status_code=status.HTTP_302_FOUND, detail="Username Already Exists!")
+
     if request.password == request.confirmation:
-        hash_pass = generate_hash(request.password)
+        hash_pass = await run_in_threadpool(generate_hash, request.password)
         db_user = models.Users(username=request.username, passwordHash=hash_pass, role=request.role)
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
     else:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Password Don't Match")
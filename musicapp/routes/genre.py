@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException, status
-from .. import database, models, schemas
+from typing import Annotated
+from fastapi import APIRouter, HTTPException, status, Header
+from sqlalchemy import select
+from .. import database, models, schemas, loaders, cache, pagination, serialization
 from .auth import user_dep
 
 router = APIRouter(
@@ -8,26 +10,34 @@ router = APIRouter(
 )
 
 
-@router.get("/all")
-def get_all_genre(db: database.db_dependency):
+@router.get("/all", response_model=schemas.Page[schemas.Genre])
+async def get_all_genre(
+    page: pagination.page_dependency,
+    if_none_match: Annotated[str | None, Header()] = None
+):
 
     """
-    Get a list of all genres.
+    Get a page of the genres, from the catalog cache when possible.
 
     Parameters:
-    - db (Session): Database session dependency.
+    - page (PageParams): The `after` cursor and `limit` of the page.
+    - if_none_match (str | None): The ETag of the response the client already has.
 
     Returns:
-    - List[Genre]: A list of all genres.
+    - Page[Genre]: The genres after the cursor and the cursor of the next page,
+                   or an empty 304 response if they haven't changed.
     """
 
-    all_genre = db.query(models.Genre).all()
-    return all_genre
+    async def load(db):
+        genres = (await db.scalars(pagination.keyset(select(models.Genre), models.Genre.id, page))).all()
+        return serialization.dump_json(schemas.Page[schemas.Genre], pagination.page_of(genres, page))
+
+    return await cache.catalog.fetch(cache.GENRES, f"all?{page}", load, if_none_match)
 
 
 @router.post('/create')
-def create_genre(
-    db: database.db_dependency,
+async def create_genre(
+    db: database.async_db_dependency,
     user: user_dep,
     request : schemas.PostGenre
 ):
@@ -36,7 +46,7 @@ def create_genre(
     Create a new genre. Only admins are allowed to perform this operation.
 
     Parameters:
-    - db (Session): Database session dependency.
+    - db (AsyncSession): Database session dependency.
     - genre (str): Name of the new genre.
     - user (dict): User information obtained from the dependency.
 
@@ -55,7 +65,7 @@ def create_genre(
         )
 
     # Check if the genre with the given name already exists
-    existing_genre = db.query(models.Genre).filter(models.Genre.genreName == request.genre).first()
+    existing_genre = await db.scalar(select(models.Genre).where(models.Genre.genreName == request.genre))
     if existing_genre:
         raise HTTPException(
             status_code=status.HTTP_302_FOUND, 
@@ -67,16 +77,17 @@ def create_genre(
 
     # Add the new genre to the database
     db.add(db_genre)
-    db.commit()
-    db.refresh(db_genre)
+    await db.commit()
+    await cache.catalog.invalidate(cache.GENRES)
+    await db.refresh(db_genre)
 
     # Return success message
     return {"detail": "Genre Created Successfully"}
 
 
 @router.put('/edit')
-def edit_genre(
-    db: database.db_dependency,
+async def edit_genre(
+    db: database.async_db_dependency,
     user: user_dep,
     request : schemas.EditGenre
 ):
@@ -85,7 +96,7 @@ def edit_genre(
     Update the name of a genre by ID. Only admins are allowed to perform this operation.
 
     Parameters:
-    - db (Session): Database session dependency.
+    - db (AsyncSession): Database session dependency.
     - genreId (int): ID of the genre to be updated.
     - editName (str): New name for the genre.
     - user (dict): User information obtained from the dependency.
@@ -105,7 +116,7 @@ def edit_genre(
         )
 
     # Retrieve the genre instance by ID
-    genre_instance = db.query(models.Genre).filter(models.Genre.id == request.genreId).first()
+    genre_instance = await db.scalar(select(models.Genre).where(models.Genre.id == request.genreId))
 
     # Check if the genre with the given ID exists
     if not genre_instance:
@@ -115,7 +126,7 @@ def edit_genre(
         )
 
     # Check if a genre with the new name already exists
-    existing_genre = db.query(models.Genre).filter(models.Genre.genreName == request.editName).first()
+    existing_genre = await db.scalar(select(models.Genre).where(models.Genre.genreName == request.editName))
     if existing_genre:
         raise HTTPException(
             status_code=status.HTTP_302_FOUND, 
@@ -124,16 +135,18 @@ def edit_genre(
 
     # Update the genre name
     genre_instance.genreName = request.editName
-    db.commit()
-    db.refresh(genre_instance)
+    await db.execute(loaders.touch_playlists(models.Songs.genreId == genre_instance.id))
+    await db.commit()
+    await cache.catalog.invalidate(*cache.CATALOG)
+    await db.refresh(genre_instance)
 
     # Return success message
     return {"detail": "Genre Updated Successfully"}
 
 
 @router.delete('/delete/{genreId}')
-def delete_genre(
-    db: database.db_dependency,
+async def delete_genre(
+    db: database.async_db_dependency,
     genreId: int,
     user: user_dep
 ):
@@ -142,7 +155,7 @@ def delete_genre(
     Delete a genre by ID. Only admins are allowed to perform this operation.
 
     Parameters:
-    - db (Session): Database session dependency.
+    - db (AsyncSession): Database session dependency.
     - genreId (int): ID of the genre to be deleted.
     - user (dict): User information obtained from the dependency.
 
@@ -161,7 +174,7 @@ def delete_genre(
         )
 
     # Retrieve the genre instance by ID
-    genre_instance = db.query(models.Genre).filter(models.Genre.id == genreId).first()
+    genre_instance = await db.scalar(select(models.Genre).where(models.Genre.id == genreId))
 
     # Check if the genre exists
     if not genre_instance:
@@ -171,8 +184,10 @@ def delete_genre(
         )
 
     # Delete the genre
-    db.delete(genre_instance)
-    db.commit()
+    await db.execute(loaders.touch_playlists(models.Songs.genreId == genreId))
+    await db.delete(genre_instance)
+    await db.commit()
+    await cache.catalog.invalidate(*cache.CATALOG)
 
     # Return success message
     return {"detail": "Genre deleted successfully"}
@@ -0,0 +1,161 @@
+from fastapi import APIRouter, HTTPException, status, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from typing import List
+from .. import database, models, schemas, jobs
+
+
+router = APIRouter(
+    tags = ["Ingest"],
+    prefix="/dump"
+)
+
+
+@router.post('', response_model=schemas.IngestJobCreated, status_code=status.HTTP_202_ACCEPTED)
+async def dump_csv_file(file: UploadFile, db: database.async_db_dependency):
+
+    """
+    Endpoint to queue the import of a CSV file.
+
+    Parameters:
+        file (UploadFile): The CSV file to import.
+        db (AsyncSession): SQLAlchemy database session.
+
+    Raises:
+        HTTPException: If the file format is not CSV.
+
+    Returns:
+        IngestJobCreated: The ID of the job processing the file.
+    """
+
+    # Check if the uploaded file is a CSV file
+    if file.content_type != 'text/csv':
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Please Upload a CSV file!")
+
+    # Persist the file and hand it to the ingest workers
+    job_id, source = await run_in_threadpool(jobs.save_source, file.file)
+    job = models.IngestJob(id=job_id, source=source, status="queued")
+    db.add(job)
+    await db.commit()
+    jobs.submit(job.id)
+
+    return {"jobId": job.id, "status": job.status}
+
+
+@router.post('/batch', response_model=schemas.IngestJobCreated, status_code=status.HTTP_202_ACCEPTED)
+async def dump_csv_files(files: List[UploadFile], db: database.async_db_dependency):
+
+    """
+    Endpoint to queue the import of several CSV files as one job.
+
+    The files are parsed in a process pool and merged into deduplicated
+    batches written by a single worker.
+
+    Parameters:
+        files (List[UploadFile]): The CSV files to import, in merge order.
+        db (AsyncSession): SQLAlchemy database session.
+
+    Raises:
+        HTTPException: If any of the files is not a CSV file.
+
+    Returns:
+        IngestJobCreated: The ID of the job processing the files.
+    """
+
+    # Check if every uploaded file is a CSV file
+    if any(file.content_type != 'text/csv' for file in files):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Please Upload only CSV files!")
+
+    # Persist the files and hand them to the ingest workers
+    job_id, source = await run_in_threadpool(jobs.save_sources, [file.file for file in files])
+    job = models.IngestJob(id=job_id, source=source, status="queued")
+    db.add(job)
+    await db.commit()
+    jobs.submit(job.id)
+
+    return {"jobId": job.id, "status": job.status}
+
+
+@router.get('/{jobId}', response_model=schemas.ShowIngestJob)
+async def get_job(jobId: str, db: database.async_db_dependency):
+
+    """
+    Get the progress of an ingest job.
+
+    Parameters:
+        jobId (str): The ID of the ingest job.
+        db (AsyncSession): SQLAlchemy database session.
+
+    Raises:
+        HTTPException: Raised with 404 status if the job is not found.
+
+    Returns:
+        ShowIngestJob: Rows processed, throughput and errors of the job.
+    """
+
+    # Retrieve the job by ID
+    job = await db.scalar(select(models.IngestJob).where(models.IngestJob.id == jobId))
+
+    # Check if the job exists
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job Not Found"
+        )
+
+    return {
+        "id": job.id,
+        "status": job.status,
+        "rowsProcessed": job.rowsProcessed,
+        "songsCreated": job.songsCreated,
+        "indexed": job.indexed,
+        "indexFailed": job.indexFailed,
+        "rowsPerSecond": jobs.rows_per_second(job),
+        "errors": job.errors or [],
+        "createdAt": job.createdAt,
+        "startedAt": job.startedAt,
+        "finishedAt": job.finishedAt
+    }
+
+
+@router.post('/{jobId}/resume', response_model=schemas.IngestJobCreated, status_code=status.HTTP_202_ACCEPTED)
+async def resume_job(jobId: str, db: database.async_db_dependency):
+
+    """
+    Resume a failed ingest job, or one left running by a worker that went away,
+    from its last committed batch.
+
+    Parameters:
+        jobId (str): The ID of the ingest job.
+        db (AsyncSession): SQLAlchemy database session.
+
+    Raises:
+        HTTPException: Raised with 404 status if the job is not found.
+        HTTPException: Raised with 409 status if the job has not failed and is not stale.
+
+    Returns:
+        IngestJobCreated: The ID and status of the requeued job.
+    """
+
+    # Retrieve the job by ID
+    job = await db.scalar(select(models.IngestJob).where(models.IngestJob.id == jobId))
+
+    # Check if the job exists
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job Not Found"
+        )
+
+    # Only failed jobs, and running jobs without progress for INGEST_STALE_SECONDS, can be resumed
+    if job.status != "failed" and not jobs.is_stale(job):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is {job.status}, only failed or stale jobs can be resumed"
+        )
+
+    job.status = "queued"
+    await db.commit()
+    jobs.submit(job.id)
+
+    return {"jobId": job.id, "status": job.status}
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, HTTPException, status
+from .. import database, cache
+from .auth import user_dep
+
+
+router = APIRouter(
+    tags = ["Metrics"],
+    prefix="/metrics"
+)
+
+
+@router.get('/db/pool')
+def get_pool_metrics(user: user_dep):
+
+    """
+    Get the usage of the database connection pools. Only admins are allowed to perform this operation.
+
+    Parameters:
+    - user (dict): User information obtained from the dependency.
+
+    Raises:
+    - HTTPException: Raised with 401 status if the user is not an admin.
+
+    Returns:
+    - dict: Pool size, checked-out, idle and overflow connections plus checkout wait times,
+            for the sync engine used by background workers, the async engine used by requests
+            and every read replica.
+    """
+
+    # Check if the user is an admin
+    if user['role'] != 1:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Only Admins can View Metrics!"
+        )
+
+    return {
+        "sync": database.pool_status(database.engine),
+        "async": database.pool_status(database.async_engine),
+        "replicas": [database.pool_status(replica) for replica in database.replica_engines]
+    }
+
+
+@router.get('/cache')
+def get_cache_metrics(user: user_dep):
+
+    """
+    Get the usage of the catalog cache. Only admins are allowed to perform this operation.
+
+    Parameters:
+    - user (dict): User information obtained from the dependency.
+
+    Raises:
+    - HTTPException: Raised with 401 status if the user is not an admin.
+
+    Returns:
+    - dict: Hits, misses, coalesced requests and invalidations per namespace since this
+            worker started, the loads in flight, plus the entries and evictions of the
+            in-process backend.
+    """
+
+    # Check if the user is an admin
+    if user['role'] != 1:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Only Admins can View Metrics!"
+        )
+
+    return cache.catalog.status()
@@ -1,43 +1,105 @@
-from fastapi import APIRouter, HTTPException, status, Query
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Query, Header, Response
+from sqlalchemy import select
+from typing import Annotated, List
 from itertools import product
 
-from .. import models, schemas, database
+from .. import models, schemas, database, loaders, cache, pagination, serialization
 from .auth import user_dep
-from ..database import es
 
 router = APIRouter(
     tags=["Playlist"],
     prefix="/playlist"
 )
 
-@router.get('/getall', status_code=status.HTTP_200_OK)
-def get_user_playlist(db: database.db_dependency, user: user_dep):
+@router.get('/getall', response_model=schemas.Page[schemas.ShowPlaylist], status_code=status.HTTP_200_OK)
+async def get_user_playlist(
+        db: database.read_db_dependency,
+        user: user_dep,
+        page: pagination.page_dependency,
+        if_none_match: Annotated[str | None, Header()] = None
+    ):
 
     """
-    Retrieve all playlists for the authenticated user.
+    Retrieve a page of the playlists of the authenticated user.
 
     Parameters:
-    - db: Session, Database session dependency.
+    - db: AsyncSession, Database session dependency.
     - user: dict, Current user details.
+    - page: PageParams, The `after` cursor and `limit` of the page.
+    - if_none_match: str | None, The ETag of the response the client already has.
 
     Returns:
-    - List[Playlist]: List of playlists for the user.
+    - Page[ShowPlaylist]: The playlists after the cursor and the cursor of the next page,
+                          or an empty 304 response if they haven't changed.
     """
 
-    # Query the database to get all playlists for the user ID
-    user_playlist = db.query(models.Playlist).filter(models.Playlist.userId == user['id']).all()
+    # Query the database to get a page of the playlists of the user ID
+    user_playlist = pagination.page_of((await db.scalars(pagination.keyset(
+        select(models.Playlist).where(models.Playlist.userId == user['id']), models.Playlist.id, page
+    ))).all(), page)
     
     # Check if any playlists were found
-    if not user_playlist:
+    if not user_playlist["items"] and page.after is None:
         # Raise an HTTPException with a 404 status code and a detail message
         raise HTTPException(
             status_code=404, 
             detail="No Playlist Found!"
         )
     
-    # Return the found playlists
-    return user_playlist
+    # Return the found playlists, tagged with a digest of them
+    body = serialization.dump_json(schemas.Page[schemas.ShowPlaylist], user_playlist)
+    return tagged_response(body, if_none_match, "playlists", user['id'])
+
+
+def check_access(playlist, user: dict):
+
+    """
+    Check that the user may read a playlist.
+
+    Raises:
+        HTTPException: Raised with a 404 status code if the playlist is not found.
+        HTTPException: Raised with a 403 status code if the user doesn't have access to the playlist.
+    """
+
+    # Check if the playlist exists
+    if not playlist:
+        # Raise an HTTPException with a 404 status code if the playlist is not found
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, 
+            detail="Playlist Doesn't Exist!"
+        )
+
+    # Check if the user has access to the playlist
+    if playlist.userId != user['id']:
+        # Raise an HTTPException with a 403 status code if the user doesn't have access
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, 
+            detail="Playlist is Not Accessible!"
+        )
+
+
+def tagged_response(body: bytes, if_none_match: str | None, *parts) -> Response:
+
+    """
+    Answer with a JSON body tagged with its digest, or with a 304 if the client already has it.
+    """
+
+    tag = cache.body_etag(body, *parts)
+
+    if cache.etag_matches(if_none_match, tag):
+        return cache.not_modified(tag)
+
+    return Response(content=body, media_type="application/json", headers={"ETag": tag})
+
+
+def playlist_tag(playlist, *parts) -> str:
+
+    """
+    Build the entity tag of a playlist response from the version of the playlist, bumped when
+    songs are added or removed and by the edits of the songs, albums, artists and genres its entries show.
+    """
+
+    return cache.etag("playlist", playlist.id, playlist.version, *parts)
 
 
 @router.get(
@@ -45,56 +107,112 @@ def get_user_playlist(db: database.db_dependency, user: user_dep):
         response_model=schemas.ShowPlaylistInfo, 
         status_code=status.HTTP_200_OK    
     )
-def show_all_songs(
-        db: database.db_dependency, 
+async def show_all_songs(
+        db: database.read_db_dependency, 
         playlistId: int, 
-        user: user_dep
+        user: user_dep,
+        if_none_match: Annotated[str | None, Header()] = None
     ):
 
     """
-    Retrieve information about a playlist.
+    Retrieve information about a playlist with the first page of its songs.
 
     Parameters:
-        db (database.db_dependency): The database dependency.
+        db (database.read_db_dependency): The database dependency.
         playlistId (int): The ID of the playlist to retrieve information for.
         user (user_dep): The current user's information.
+        if_none_match (str | None): The ETag of the response the client already has.
 
     Returns:
-        schemas.ShowPlaylistInfo: The information about the playlist.
+        schemas.ShowPlaylistInfo: The information about the playlist, or an empty 304 response if it hasn't changed.
 
     Raises:
         HTTPException: Raised with a 404 status code if the playlist is not found.
         HTTPException: Raised with a 403 status code if the user doesn't have access to the playlist.
     """
 
+    # Load the playlist with its owner
+    playlist = await db.scalar(
+        select(models.Playlist).where(models.Playlist.id == playlistId).options(*loaders.playlist_info())
+    )
+    check_access(playlist, user)
+
+    # Answer from the playlist row alone if the client's copy is still current
+    tag = playlist_tag(playlist)
+    if cache.etag_matches(if_none_match, tag):
+        return cache.not_modified(tag)
+
+    # Load the first page of its songs with everything the response shows
+    entries = await loaders.playlist_song_page(db, playlistId, pagination.FIRST_PAGE)
+
+    # Return the playlist information, tagged with its version
+    body = serialization.dump_json(
+        schemas.ShowPlaylistInfo,
+        {
+            "id": playlist.id,
+            "playlistName": playlist.playlistName,
+            "users": playlist.users,
+            "playlistSong": entries
+        }
+    )
+    return Response(content=body, media_type="application/json", headers={"ETag": tag})
+
+
+@router.get(
+        "/info/{playlistId}/songs", 
+        response_model=schemas.Page[schemas.PlaylistSongs], 
+        status_code=status.HTTP_200_OK    
+    )
+async def show_playlist_songs(
+        db: database.read_db_dependency, 
+        playlistId: int, 
+        user: user_dep,
+        page: pagination.page_dependency,
+        if_none_match: Annotated[str | None, Header()] = None
+    ):
+
+    """
+    Retrieve a page of the songs of a playlist, in the order they were added.
+
+    Parameters:
+        db (database.read_db_dependency): The database dependency.
+        playlistId (int): The ID of the playlist.
+        user (user_dep): The current user's information.
+        page (pagination.PageParams): The `after` cursor and `limit` of the page.
+        if_none_match (str | None): The ETag of the response the client already has.
 
-    # Query the database to find the playlist by playlistId
-    playlist = db.query(models.Playlist).filter(models.Playlist.id == playlistId).first()
+    Returns:
+        schemas.Page[schemas.PlaylistSongs]: The songs after the cursor and the cursor of the next page,
+                                             or an empty 304 response if they haven't changed.
 
-    # Check if the playlist exists
-    if not playlist:
-        # Raise an HTTPException with a 404 status code if the playlist is not found
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, 
-            detail="Playlist Doesn't Exist!"
-        )
+    Raises:
+        HTTPException: Raised with a 404 status code if the playlist is not found.
+        HTTPException: Raised with a 403 status code if the user doesn't have access to the playlist.
+    """
 
-    # Check if the user has access to the playlist
-    if playlist.users.id != user['id']:
-        # Raise an HTTPException with a 403 status code if the user doesn't have access
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, 
-            detail="Playlist is Not Accessible!"
-        )
+    # Query the database for the owner and the version of the playlist only
+    playlist = (await db.execute(
+        select(models.Playlist.id, models.Playlist.userId, models.Playlist.version)
+        .where(models.Playlist.id == playlistId)
+    )).first()
+    check_access(playlist, user)
 
-    # Return the playlist information
-    return playlist
+    # Answer from the playlist row alone if the client's copy is still current
+    tag = playlist_tag(playlist, page.after, page.limit)
+    if cache.etag_matches(if_none_match, tag):
+        return cache.not_modified(tag)
+
+    entries = await loaders.playlist_song_page(db, playlistId, page)
+
+    body = serialization.dump_json(schemas.Page[schemas.PlaylistSongs], entries)
+    return Response(content=body, media_type="application/json", headers={"ETag": tag})
 
 
 @router.post('/create', status_code=status.HTTP_201_CREATED)
-def create_playlist(
+async def create_playlist(
         request: schemas.Playlist, 
-        db: database.db_dependency, 
+        db: database.async_db_dependency, 
+        es: database.es_dependency,
         user: user_dep
     ):
 
@@ -103,7 +221,8 @@ def create_playlist(
 
     Parameters:
         request (schemas.Playlist): The request payload containing the playlist information.
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
+        es (database.es_dependency): The Elasticsearch client.
         user (user_dep): The current user's information.
 
     Returns:
@@ -113,10 +232,15 @@ def create_playlist(
         HTTPException: Raised with a 302 status code if the playlist already exists.
     """
 
-    # Check if the playlist with the given name already exists
-    existing_playlist = db.query(models.Playlist).filter(models.Playlist.playlistName == request.playlistName).first()
+    # Check if the user already has a playlist with the given name
+    existing_playlist = await db.scalar(
+        select(models.Playlist).where(
+            models.Playlist.playlistName == request.playlistName,
+            models.Playlist.userId == user['id']
+        )
+    )
     
-    if existing_playlist and existing_playlist.userId == user['id']:
+    if existing_playlist:
         # Raise an HTTPException with a 302 status code if the playlist already exists
         raise HTTPException(
             status_code=status.HTTP_302_FOUND, 
@@ -126,7 +250,7 @@ def create_playlist(
     # Create a new playlist instance and add it to the database
     new_playlist = models.Playlist(playlistName=request.playlistName, userId=user['id'])
     db.add(new_playlist)
-    db.commit()
+    await db.commit()
 
     # Index the playlist information in Elasticsearch
     playlist_document = {
@@ -135,18 +259,19 @@ def create_playlist(
         "creator": user['id'],
         "playlistSong": []
     }
-    es.index(index="playlist", body=playlist_document, id=new_playlist.id)
+    await database.es_call(es.index, index="playlist", body=playlist_document, id=new_playlist.id)
 
     # Refresh the database instance
-    db.refresh(new_playlist)
+    await db.refresh(new_playlist)
 
     # Return the newly created playlist
     return new_playlist
 
 
 @router.post('/create/condition/', status_code=status.HTTP_201_CREATED)
-def create_by_condition(
-    db: database.db_dependency,
+async def create_by_condition(
+    db: database.async_db_dependency,
+    es: database.es_dependency,
     user: user_dep,
     request: schemas.CreateByCondition,
     artists: list[str] = Query(None, title="List of artists", description="Specify one or more artists"),
@@ -157,7 +282,8 @@ def create_by_condition(
     Create a playlist based on specified conditions.
 
     Parameters:
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
+        es (database.es_dependency): The Elasticsearch client.
         user (user_dep): The current user's information.
         request (schemas.CreateByCondition): The request payload containing the playlist information.
         artists (list[str]): List of artists to consider in the playlist.
@@ -172,8 +298,13 @@ def create_by_condition(
         HTTPException: Raised with a 201 status code if the playlist is created successfully.
     """
 
-    # Check if the playlist with the given name already exists
-    existing_playlist = db.query(models.Playlist).filter(models.Playlist.playlistName == request.playlist).first()
+    # Check if the user already has a playlist with the given name
+    existing_playlist = await db.scalar(
+        select(models.Playlist).where(
+            models.Playlist.playlistName == request.playlist,
+            models.Playlist.userId == user['id']
+        )
+    )
     
     if existing_playlist:
         # Raise an HTTPException with a 302 status code if the playlist already exists
@@ -196,7 +327,7 @@ def create_by_condition(
             },
             "size": 5
         }
-        response = es.search(index="songs", body=query)
+        response = await database.es_call(es.search, index="songs", body=query)
         res += response['hits']['hits']
 
     if not res:
@@ -209,15 +340,18 @@ def create_by_condition(
     # Create a new playlist and add songs to it
     new_playlist = models.Playlist(playlistName=request.playlist, userId=user['id'])
     db.add(new_playlist)
-    db.commit()
+    await db.commit()
 
     songs = []
     for result in res:
+        # A song matching several conditions is added once
+        if result["_source"]["songId"] in songs:
+            continue
         playlist_song = models.PlaylistSong(playlistId=new_playlist.id, songId=result["_source"]["songId"])
         songs.append(result["_source"]["songId"])
         db.add(playlist_song)
     
-    db.commit()
+    await db.commit()
 
     # Index the playlist information in Elasticsearch
     playlist_document = {
@@ -226,16 +360,17 @@ def create_by_condition(
         "creator": user['id'],
         "playlistSong": songs
     }
-    es.index(index="playlist", body=playlist_document)
+    await database.es_call(es.index, index="playlist", body=playlist_document)
 
     return { "detail" : "Playlist Created Successfully" }
 
 
 @router.patch('/{playlistId}/add/{songId}', status_code=status.HTTP_200_OK)
-def add_song_to_playlist(
+async def add_song_to_playlist(
         playlistId: int, 
         songId: int, 
-        db: database.db_dependency, 
+        db: database.async_db_dependency, 
+        es: database.es_dependency,
         user: user_dep
     ):
 
@@ -245,7 +380,8 @@ def add_song_to_playlist(
     Parameters:
         playlistId (int): The ID of the playlist.
         songId (int): The ID of the song to be added.
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
+        es (database.es_dependency): The Elasticsearch client.
         user (user_dep): The current user's information.
 
     Raises:
@@ -257,7 +393,7 @@ def add_song_to_playlist(
     """
 
     # Check if the playlist exists
-    playlist = db.query(models.Playlist).filter(models.Playlist.id == playlistId).first()
+    playlist = await db.scalar(select(models.Playlist).where(models.Playlist.id == playlistId))
 
     if not playlist:
         # Raise an HTTPException with a 404 status code if the playlist doesn't exist
@@ -267,7 +403,7 @@ def add_song_to_playlist(
         )
 
     # Check if the playlist is accessible by the user
-    if playlist.users.id != user['id']:
+    if playlist.userId != user['id']:
         # Raise an HTTPException with a 403 status code if the playlist is not accessible
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, 
@@ -275,7 +411,7 @@ def add_song_to_playlist(
         )
 
     # Check if the song exists
-    song = db.query(models.Songs).filter(models.Songs.id == songId).first()
+    song = await db.scalar(select(models.Songs).where(models.Songs.id == songId))
 
     if not song:
         # Raise an HTTPException with a 404 status code if the song doesn't exist
@@ -285,7 +421,9 @@ def add_song_to_playlist(
         )
 
     # Check if the song is already in the playlist
-    songs = [i.songId for i in playlist.playlistSong]
+    songs = list((await db.scalars(
+        select(models.PlaylistSong.songId).where(models.PlaylistSong.playlistId == playlistId)
+    )).all())
     if songId in songs:
         # Raise an HTTPException with a 302 status code if the song is already in the playlist
         raise HTTPException(
@@ -296,22 +434,24 @@ def add_song_to_playlist(
     # Add the song to the playlist
     playlist_song = models.PlaylistSong(playlistId=playlistId, songId=songId)
     db.add(playlist_song)
-    db.commit()
+    playlist.version = models.Playlist.version + 1
+    await db.commit()
 
     # Update the playlist in Elasticsearch
     songs.append(songId)
-    es.update(index="playlist", id=playlistId, doc={"playlistSong": songs})
-    db.refresh(playlist_song)
+    await database.es_call(es.update, index="playlist", id=playlistId, doc={"playlistSong": songs})
+    await db.refresh(playlist_song)
 
     return { "detail" : "Song Added to the Playlist Successfully" }
 
 
 @router.patch('/{playlistId}/remove/{songId}')
-def del_song_from_playlist(
+async def del_song_from_playlist(
         user: user_dep, 
         playlistId: int, 
         songId: int, 
-        db: database.db_dependency
+        db: database.async_db_dependency,
+        es: database.es_dependency
     ):
 
     """
@@ -321,7 +461,8 @@ def del_song_from_playlist(
         user (user_dep): The current user's information.
         playlistId (int): The ID of the playlist.
         songId (int): The ID of the song to be removed.
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
+        es (database.es_dependency): The Elasticsearch client.
 
     Raises:
         HTTPException: Raised with a 404 status code if the playlist doesn't exist.
@@ -331,7 +472,7 @@ def del_song_from_playlist(
     """
 
     # Check if the playlist exists
-    playlist = db.query(models.Playlist).filter(models.Playlist.id == playlistId).first()
+    playlist = await db.scalar(select(models.Playlist).where(models.Playlist.id == playlistId))
 
     if not playlist:
         # Raise an HTTPException with a 404 status code if the playlist doesn't exist
@@ -341,7 +482,7 @@ def del_song_from_playlist(
         )
 
     # Check if the playlist is accessible by the user
-    if playlist.users.id != user['id']:
+    if playlist.userId != user['id']:
         # Raise an HTTPException with a 403 status code if the playlist is not accessible
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, 
@@ -349,10 +490,12 @@ def del_song_from_playlist(
         )
 
     # Check if the song exists in the playlist
-    playlist_instance = db.query(models.PlaylistSong).filter(
-        models.PlaylistSong.playlistId == playlistId, 
-        models.PlaylistSong.songId == songId
-    ).first()
+    playlist_instance = await db.scalar(
+        select(models.PlaylistSong).where(
+            models.PlaylistSong.playlistId == playlistId, 
+            models.PlaylistSong.songId == songId
+        )
+    )
 
     if not playlist_instance:
         # Raise an HTTPException with a 404 status code if the song doesn't exist in the playlist
@@ -362,24 +505,28 @@ def del_song_from_playlist(
         )
 
     # Remove the song from the playlist
-    es_playlist = es.get(index="playlist", id=playlistId)
+    es_playlist = await database.es_call(es.get, index="playlist", id=playlistId)
     es_playlist.body['_source']['playlistSong'].remove(songId)
 
-    db.delete(playlist_instance)
-    db.commit()
+    await db.delete(playlist_instance)
+    playlist.version = models.Playlist.version + 1
+    await db.commit()
 
     # Update the playlist in Elasticsearch
-    es.update(index="playlist", id=playlistId, doc={"playlistSong": es_playlist.body['_source']['playlistSong']})
+    await database.es_call(
+        es.update, index="playlist", id=playlistId, doc={"playlistSong": es_playlist.body['_source']['playlistSong']}
+    )
 
     # Raise an HTTPException with a 200 status code if the song is removed from the playlist successfully
     return { "detail" : "Songs Removed from the Playlist" }
 
 
 @router.delete('/delete/{playlistId}')
-def delete_playlist(
+async def delete_playlist(
         user: user_dep, 
         playlistId: int, 
-        db: database.db_dependency
+        db: database.async_db_dependency,
+        es: database.es_dependency
     ):
 
     """
@@ -388,7 +535,8 @@ def delete_playlist(
     Parameters:
         user (user_dep): The current user's information.
         playlistId (int): The ID of the playlist to be deleted.
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
+        es (database.es_dependency): The Elasticsearch client.
 
     Raises:
         HTTPException: Raised with a 404 status code if the playlist doesn't exist.
@@ -397,7 +545,7 @@ def delete_playlist(
     """
 
     # Check if the playlist exists
-    playlist_object = db.query(models.Playlist).filter(models.Playlist.id == playlistId).first()
+    playlist_object = await db.scalar(select(models.Playlist).where(models.Playlist.id == playlistId))
 
     if not playlist_object:
         # Raise an HTTPException with a 404 status code if the playlist doesn't exist
@@ -406,7 +554,7 @@ def delete_playlist(
             detail="Playlist Not Found")
 
     # Check if the playlist is accessible by the user
-    if playlist_object.users.id != user['id']:
+    if playlist_object.userId != user['id']:
         # Raise an HTTPException with a 403 status code if the playlist is not accessible
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, 
@@ -414,11 +562,11 @@ def delete_playlist(
         )
 
     # Delete the playlist
-    db.delete(playlist_object)
-    db.commit()
+    await db.delete(playlist_object)
+    await db.commit()
 
     # Delete the playlist from Elasticsearch
-    es.delete(index="playlist", id=playlistId)
+    await database.es_call(es.delete, index="playlist", id=playlistId)
 
     # Raise an HTTPException with a 200 status code if the playlist is deleted successfully
     raise HTTPException(
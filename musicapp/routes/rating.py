@@ -1,9 +1,17 @@
+import os
+from typing import List
 from fastapi import APIRouter, HTTPException, status
-from sqlalchemy import func
-from .. import database, models, schemas
+from sqlalchemy import Float, Integer, literal, select
+from .. import database, models, schemas, ratings
 from . import auth
 
 
+# Songs one batch lookup may ask for, about a page of song cards
+MAX_BATCH_SONGS = int(os.environ.get("MAX_BATCH_SONGS", 200))
+
+# Historical ratings written per INSERT when importing
+IMPORT_BATCH_SIZE = int(os.environ.get("RATING_IMPORT_BATCH_SIZE", 1000))
+
 router = APIRouter(
     tags = ['Ratings'],
     prefix="/rate"
@@ -11,14 +19,14 @@ router = APIRouter(
 
 
 @router.get('/{songId}')
-def get_rating(songId: int, db: database.db_dependency):
+async def get_rating(songId: int, db: database.read_db_dependency):
 
     """
-    Get the average rating for a song.
+    Get the average rating for a song from its running aggregates, without reading its ratings.
 
     Parameters:
         songId (int): The ID of the song for which to retrieve the rating.
-        db (database.db_dependency): The database dependency.
+        db (database.read_db_dependency): The database dependency.
 
     Raises:
         HTTPException: Raised with a 404 status code if the song doesn't exist.
@@ -27,32 +35,86 @@ def get_rating(songId: int, db: database.db_dependency):
         dict: A dictionary containing the average rating for the song.
     """
 
-    # Check if the song exists
-    song = db.query(models.Songs).filter(models.Songs.id == songId).first()
+    # Read the rating aggregates of the song, which also checks that it exists
+    aggregates = (await db.execute(
+        select(models.Songs.ratingSum, models.Songs.ratingCount).where(models.Songs.id == songId)
+    )).first()
 
-    if not song:
+    if not aggregates:
         # Raise an HTTPException with a 404 status code if the song doesn't exist
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="Song Not Found"
         )
 
-    # Calculate the average rating for the song
-    average_rating = (
-        db.query(func.avg(models.Rating.rating).label("average_rating"))
-        .filter(models.Rating.songId == songId)
-        .scalar()
-    )
-
-    # Set average_rating to 0 if it is None
-    average_rating = average_rating or 0
+    # The average of an unrated song is 0
+    average_rating = ratings.average(*aggregates)
 
     # Return a dictionary containing the average rating
     return {"rating": average_rating}
 
+@router.post('/batch', response_model=List[schemas.SongRatingSummary])
+async def get_ratings(user: auth.user_dep, db: database.read_db_dependency, request: schemas.BatchRating):
+
+    """
+    Get the average rating, the number of ratings and the user's own rating of several songs at once,
+    in two queries whatever the number of songs.
+
+    Parameters:
+        user (auth.user_dep): The authenticated user.
+        db (database.read_db_dependency): The database dependency.
+        request (schemas.BatchRating): The IDs of the songs.
+
+    Raises:
+        HTTPException: Raised with a 400 status code if more than MAX_BATCH_SONGS songs are asked for.
+
+    Returns:
+        list[schemas.SongRatingSummary]: The ratings of the songs that exist, in the order asked for.
+    """
+
+    # Ask for each song once, keeping the order of the request
+    song_ids = list(dict.fromkeys(request.songIds))
+
+    if len(song_ids) > MAX_BATCH_SONGS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_SONGS} songs can be looked up at once"
+        )
+
+    if not song_ids:
+        return []
+
+    # Read the rating aggregates of every song in one query
+    aggregates = {
+        row.id: row for row in (await db.execute(
+            select(models.Songs.id, models.Songs.ratingSum, models.Songs.ratingCount)
+            .where(models.Songs.id.in_(song_ids))
+        ))
+    }
+
+    # Read the user's own ratings of those songs in one query
+    own = dict((await db.execute(
+        select(models.Rating.songId, models.Rating.rating).where(
+            models.Rating.byUserId == user['id'],
+            models.Rating.songId.in_(list(aggregates))
+        )
+    )).all()) if aggregates else {}
+
+    # Songs that don't exist are left out
+    return [
+        schemas.SongRatingSummary(
+            songId=songId,
+            rating=ratings.average(aggregates[songId].ratingSum, aggregates[songId].ratingCount),
+            count=aggregates[songId].ratingCount or 0,
+            userRating=own.get(songId)
+        )
+        for songId in song_ids if songId in aggregates
+    ]
+
+
 @router.get('/user/{songId}')
-def is_user_rated(user : auth.user_dep, songId : int, db : database.db_dependency):
-    rating = db.query(models.Rating).filter(models.Rating.byUserId == user['id'], models.Rating.songId == songId).first()
+async def is_user_rated(user : auth.user_dep, songId : int, db : database.read_db_dependency):
+    rating = await db.scalar(select(models.Rating).where(models.Rating.byUserId == user['id'], models.Rating.songId == songId))
 
     if not rating:
         return {rating : 0}
@@ -60,36 +122,25 @@ def is_user_rated(user : auth.user_dep, songId : int, db : database.db_dependenc
 
 
 @router.post('/')
-def rate_song(user: auth.user_dep, db: database.db_dependency, request : schemas.PostRating):
+async def rate_song(user: auth.user_dep, db: database.async_db_dependency, request : schemas.PostRating):
 
     """
-    Rate a song.
+    Rate a song. Rating a song again keeps the first rating, so retried requests are harmless.
 
     Parameters:
         user (auth.user_dep): The authenticated user making the rating.
         songId (int): The ID of the song to be rated.
         rating (float): The rating to be given to the song.
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
 
     Raises:
         HTTPException: Raised with a 404 status code if the song doesn't exist.
         HTTPException: Raised with a 400 status code if the rating is not within the valid range.
-        HTTPException: Raised with a 404 status code if the user has already rated the song.
 
     Returns:
         dict: A dictionary indicating the success of the rating operation.
     """
 
-    # Check if the song exists
-    song = db.query(models.Songs).filter(models.Songs.id == request.songId).first()
-
-    if not song:
-        # Raise an HTTPException with a 404 status code if the song doesn't exist
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, 
-            detail="Song Not Found"
-        )
-
     # Check if the rating is within the valid range (0 to 5)
     if not (0.0 <= request.rating <= 5.0):
         # Raise an HTTPException with a 400 status code if the rating is not within the valid range
@@ -98,29 +149,85 @@ def rate_song(user: auth.user_dep, db: database.db_dependency, request : schemas
             detail="Rating must be within the range of (0, 5)"
         )
 
-    # Check if the user has already rated the song
-    rating_instance = db.query(models.Rating).filter(
-        models.Rating.byUserId == user['id'],
-        models.Rating.songId == request.songId
-    ).first()
+    # Insert the rating only if the song exists and the user hasn't rated it yet, in the same statement
+    source = select(
+        literal(request.rating, Float), literal(user['id'], Integer), models.Songs.id
+    ).where(models.Songs.id == request.songId)
 
-    new_rating = models.Rating(rating=request.rating, byUserId=user['id'], songId=request.songId)
+    if not await ratings.insert_ratings(db, source, [request.songId]):
+        # Nothing was inserted, either the song doesn't exist or the user already rated it
+        song = await db.scalar(select(models.Songs.id).where(models.Songs.id == request.songId))
 
-    if not rating_instance:
-        db.add(new_rating)
-        
-    # Create a new rating instance and add it to the database
-    db.commit()
+        if not song:
+            # Raise an HTTPException with a 404 status code if the song doesn't exist
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, 
+                detail="Song Not Found"
+            )
 
-    if not rating_instance:
-        db.refresh(new_rating)
+        return {"detail": "Song is Rated Successfully!"}
+
+    await db.commit()
 
     # Return a dictionary indicating the success of the rating operation
     return {"detail": "Song is Rated Successfully!"}
 
 
+@router.post('/import')
+async def import_ratings(user: auth.user_dep, db: database.async_db_dependency, request: List[schemas.ImportRating]):
+
+    """
+    Import historical ratings in bulk. Only admins are allowed to perform this operation.
+
+    Ratings a user already gave are kept, so an import can be retried or replayed.
+
+    Parameters:
+        user (auth.user_dep): The authenticated user.
+        db (database.async_db_dependency): The database dependency.
+        request (List[schemas.ImportRating]): The ratings to import.
+
+    Raises:
+        HTTPException: Raised with a 401 status code if the user is not an admin.
+
+    Returns:
+        dict: The number of ratings imported and skipped.
+    """
+
+    # Check if the user is an admin
+    if user['role'] != 1:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Only Admins can Import Ratings!"
+        )
+
+    # Ratings outside of the valid range are skipped
+    rows = [row.model_dump() for row in request if 0.0 <= row.rating <= 5.0]
+
+    # Insert the ratings in batches, all in one transaction
+    imported = 0
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        batch = rows[start:start + IMPORT_BATCH_SIZE]
+
+        # Ratings of songs or by users that don't exist are skipped, checked a batch at a time
+        # to keep the IN lists within the bind parameter limit of the driver
+        song_ids = set((await db.scalars(
+            select(models.Songs.id).where(models.Songs.id.in_({row["songId"] for row in batch}))
+        )).all())
+        user_ids = set((await db.scalars(
+            select(models.Users.id).where(models.Users.id.in_({row["byUserId"] for row in batch}))
+        )).all())
+        batch = [row for row in batch if row["songId"] in song_ids and row["byUserId"] in user_ids]
+
+        if batch:
+            imported += await ratings.insert_ratings(db, batch)
+
+    await db.commit()
+
+    return {"detail": "Ratings Imported Successfully!", "imported": imported, "skipped": len(request) - imported}
+
+
 @router.put('/edit')
-def edit_rating(user: auth.user_dep, db: database.db_dependency, request : schemas.PostRating):
+async def edit_rating(user: auth.user_dep, db: database.async_db_dependency, request : schemas.PostRating):
 
     """
     Edit the rating of a song.
@@ -129,7 +236,7 @@ def edit_rating(user: auth.user_dep, db: database.db_dependency, request : schem
         user (auth.user_dep): The authenticated user editing the rating.
         songId (int): The ID of the song whose rating is to be edited.
         rating (float): The new rating to be assigned to the song.
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
 
     Raises:
         HTTPException: Raised with a 404 status code if the song doesn't exist.
@@ -141,7 +248,7 @@ def edit_rating(user: auth.user_dep, db: database.db_dependency, request : schem
     """
 
     # Check if the song exists
-    song = db.query(models.Songs).filter(models.Songs.id == request.songId).first()
+    song = await db.scalar(select(models.Songs).where(models.Songs.id == request.songId))
 
     if not song:
         # Raise an HTTPException with a 404 status code if the song doesn't exist
@@ -159,10 +266,12 @@ def edit_rating(user: auth.user_dep, db: database.db_dependency, request : schem
         )
 
     # Check if the user has rated the song
-    rating_instance = db.query(models.Rating).filter(
-        models.Rating.byUserId == user['id'],
-        models.Rating.songId == request.songId
-    ).first()
+    rating_instance = await db.scalar(
+        select(models.Rating).where(
+            models.Rating.byUserId == user['id'],
+            models.Rating.songId == request.songId
+        ).with_for_update()
+    )
 
     if not rating_instance:
         # Raise an HTTPException with a 404 status code if the user hasn't rated the song yet
@@ -171,17 +280,17 @@ def edit_rating(user: auth.user_dep, db: database.db_dependency, request : schem
             detail="You Haven't Rated this song yet!"
         )
 
-    # Update the rating of the song
+    # Update the rating of the song and move the song's sum by the difference
+    await db.execute(ratings.adjust(request.songId, request.rating - rating_instance.rating, 0))
     rating_instance.rating = request.rating
-    db.commit()
-    db.refresh(rating_instance)
+    await db.commit()
 
     # Return a dictionary indicating the success of the rating update operation
     return {"detail": "Song Rating Updated Successfully!"}
 
 
 @router.delete('/delete/{songId}')
-def delete_rating(user: auth.user_dep, songId: int, db: database.db_dependency):
+async def delete_rating(user: auth.user_dep, songId: int, db: database.async_db_dependency):
 
     """
     Delete the rating of a song.
@@ -189,7 +298,7 @@ def delete_rating(user: auth.user_dep, songId: int, db: database.db_dependency):
     Parameters:
         user (auth.user_dep): The authenticated user deleting the rating.
         songId (int): The ID of the song whose rating is to be deleted.
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
 
     Raises:
         HTTPException: Raised with a 404 status code if the song doesn't exist.
@@ -200,7 +309,7 @@ def delete_rating(user: auth.user_dep, songId: int, db: database.db_dependency):
     """
 
     # Check if the song exists
-    song = db.query(models.Songs).filter(models.Songs.id == songId).first()
+    song = await db.scalar(select(models.Songs).where(models.Songs.id == songId))
 
     if not song:
         # Raise an HTTPException with a 404 status code if the song doesn't exist
@@ -210,10 +319,12 @@ def delete_rating(user: auth.user_dep, songId: int, db: database.db_dependency):
         )
 
     # Check if the user has rated the song
-    rating_instance = db.query(models.Rating).filter(
-        models.Rating.byUserId == user['id'],
-        models.Rating.songId == songId
-    ).first()
+    rating_instance = await db.scalar(
+        select(models.Rating).where(
+            models.Rating.byUserId == user['id'],
+            models.Rating.songId == songId
+        ).with_for_update()
+    )
 
     if not rating_instance:
         # Raise an HTTPException with a 404 status code if the user hasn't rated the song yet
@@ -222,9 +333,41 @@ def delete_rating(user: auth.user_dep, songId: int, db: database.db_dependency):
             detail="You Haven't Rated this song yet!"
         )
 
-    # Delete the rating of the song
-    db.delete(rating_instance)
-    db.commit()
+    # Delete the rating of the song and take it out of the song's aggregates
+    await db.execute(ratings.adjust(songId, -rating_instance.rating, -1))
+    await db.delete(rating_instance)
+    await db.commit()
 
     # Return a dictionary indicating the success of the rating deletion operation
     return {"detail": "Song Rating Deleted Successfully!"}
+
+
+@router.post('/repair')
+async def repair_ratings(user: auth.user_dep, db: database.async_db_dependency):
+
+    """
+    Recompute the rating aggregates of every song from the rating table. Only admins are allowed to perform this operation.
+
+    Parameters:
+        user (auth.user_dep): The authenticated user.
+        db (database.async_db_dependency): The database dependency.
+
+    Raises:
+        HTTPException: Raised with a 401 status code if the user is not an admin.
+
+    Returns:
+        dict: The number of songs repaired.
+    """
+
+    # Check if the user is an admin
+    if user['role'] != 1:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Only Admins can Repair Ratings!"
+        )
+
+    # Recompute every song's sum and count in one statement
+    repaired = (await db.execute(ratings.recompute())).rowcount
+    await db.commit()
+
+    return {"detail": "Song Ratings Repaired Successfully!", "songs": repaired}
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
+from sqlalchemy import select
 from .. import database, models, schemas
-from ..database import es
 from .auth import user_dep
 
 
@@ -10,7 +10,7 @@ router = APIRouter(
 
 
 @router.post('/search')
-def search_query(user: user_dep, request : schemas.SearchQuery):
+async def search_query(user: user_dep, es: database.es_dependency, request : schemas.SearchQuery):
 
     """
     Search for songs and playlists based on a given query.
@@ -18,6 +18,7 @@ def search_query(user: user_dep, request : schemas.SearchQuery):
     Parameters:
         query (str): The search query.
         user (user_dep): The authenticated user.
+        es (database.es_dependency): The Elasticsearch client.
 
     Returns:
         list: A list of search results, including songs and playlists.
@@ -34,40 +35,36 @@ def search_query(user: user_dep, request : schemas.SearchQuery):
     }
 
     # Perform a search using Elasticsearch
-    response = es.search(body=wildcard_query, index=["songs", "playlist"])
+    response = await database.es_call(es.search, body=wildcard_query, index=["songs", "playlist"])
 
     # Return the search results
     return response['hits']['hits']
 
 
 @router.post('/recommend')
-def recommend_song(user: user_dep, db: database.db_dependency):
+async def recommend_song(user: user_dep, db: database.read_db_dependency, es: database.es_dependency):
 
     """
     Get song recommendations based on the user's playlists.
 
     Parameters:
         user (user_dep): The authenticated user.
-        db (database.db_dependency): The database dependency.
+        db (database.read_db_dependency): The database dependency.
+        es (database.es_dependency): The Elasticsearch client.
 
     Returns:
         list: A list of recommended songs based on the user's playlists.
     """
 
-    # Retrieve the user's playlist from the database
-    user_playlist = db.query(models.Users).filter(models.Users.id == user['id']).first()
+    # Retrieve the songs of the user's playlists in one query
+    song_ids = (await db.scalars(
+        select(models.PlaylistSong.songId)
+        .join(models.Playlist, models.Playlist.id == models.PlaylistSong.playlistId)
+        .where(models.Playlist.userId == user['id'])
+    )).all()
 
     # Create a list to store all songs from the user's playlists
-    all_songs = []
-
-    # Iterate through each playlist and its associated songs
-    for playlist in user_playlist.playlists:
-        for rec in playlist.playlistSong:
-            record = {
-                "_index": "songs",
-                "_id": rec.songId
-            }
-            all_songs.append(record)
+    all_songs = [{"_index": "songs", "_id": song_id} for song_id in song_ids]
 
     # Build a query for Elasticsearch using the "more_like_this" feature
     query = {
@@ -83,14 +80,14 @@ def recommend_song(user: user_dep, db: database.db_dependency):
     }
 
     # Perform a search using Elasticsearch
-    response = es.search(index="songs", body=query)
+    response = await database.es_call(es.search, index="songs", body=query)
 
     # Return the recommended songs
     return response['hits']['hits']
 
 
 @router.post('/suggest')
-def suggest_item(db: database.db_dependency, user : user_dep, request : schemas.SuggestItem):
+async def suggest_item(db: database.async_db_dependency, user : user_dep, request : schemas.SuggestItem):
     db_instance = models.Suggestion(
         byUserId = user['id'], 
         toUserId = request.toUserId, 
@@ -99,7 +96,7 @@ def suggest_item(db: database.db_dependency, user : user_dep, request : schemas.
     )
 
     db.add(db_instance)
-    db.commit()
-    db.refresh(db_instance)
+    await db.commit()
+    await db.refresh(db_instance)
 
     return {"detail" : "Suggestion Sent Successfully"}
\ No newline at end of file
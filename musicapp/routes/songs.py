@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException, status, UploadFile
+import os
+from datetime import datetime
+from typing import Annotated
+from fastapi import APIRouter, HTTPException, status, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
 from uuid import uuid4
-from .. import database, schemas, models
-from ..database import es
+from .. import database, schemas, models, media, analysis, loaders, cache, serialization
 from .auth import user_dep
 
 router = APIRouter(
@@ -10,54 +14,237 @@ router = APIRouter(
 )
 
 
+async def validate_new_song(db, user: dict, songName: str, genreId: int, artistId: int, albumId: int):
+
+    """
+    Check that the user may create a song with the given name, album, artist and genre.
+
+    Raises:
+        HTTPException: If the user is not an admin (HTTP 401),
+                       if the song with the specified name already exists (HTTP 302),
+                       if the specified album, artist, or genre is not found (HTTP 404).
+    """
+
+    # Check if the user has admin privileges
+    if user['role'] != 1:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail="Only Admins can create a song!"
+        )
+
+    # Check if the song with the specified name already exists
+    existing_song = await db.scalar(select(models.Songs).where(models.Songs.songName == songName))
+    if existing_song:
+        raise HTTPException(
+            status_code=status.HTTP_302_FOUND, 
+            detail="Song already exists!"
+        )
+
+    # Query the database for album, artist, and genre
+    album = await db.scalar(select(models.Album).where(models.Album.id == albumId))
+    genre = await db.scalar(select(models.Genre).where(models.Genre.id == genreId))
+    artist = await db.scalar(select(models.Artist).where(models.Artist.id == artistId))
+
+    # Check if the specified album, artist, and genre exist
+    if not (album and genre and artist):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, 
+            detail="Please specify valid IDs for album, artist, and genre."
+        )
+
+
+async def index_song(es, db_song: models.Songs):
+
+    """
+    Index a newly created song in Elasticsearch under its ID.
+    """
+
+    document = {
+        "songId": db_song.id,
+        "songName": db_song.songName,
+        "artistName": db_song.artist.artistName,
+        "genreName": db_song.genre.genreName,
+        "albumName": db_song.album.albumName
+    }
+    await database.es_call(es.index, index="songs", body=document, id=db_song.id)
+
+
+async def load_song(db, songId: int) -> models.Songs | None:
+
+    """
+    Load a song with the artist, genre and album its responses and documents show.
+    """
+
+    return await db.scalar(select(models.Songs).where(models.Songs.id == songId).options(*loaders.song()))
+
+
+async def get_session(db, user: dict, sessionId: str, lock: bool = False) -> models.UploadSession:
+
+    """
+    Load an upload session owned by the current user.
+
+    Raises:
+        HTTPException: If the upload session is not found (HTTP 404).
+    """
+
+    query = select(models.UploadSession).where(
+        models.UploadSession.id == sessionId,
+        models.UploadSession.userId == user['id']
+    )
+
+    # Serialise concurrent requests on the same session
+    if lock:
+        query = query.with_for_update()
+
+    session = await db.scalar(query)
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload Session Not Found"
+        )
+
+    return session
+
+
 @router.get('/{songId}', response_model=schemas.ShowSong)
-def show_song(db: database.db_dependency, songId: int):
+async def show_song(
+    songId: int,
+    if_none_match: Annotated[str | None, Header()] = None
+):
     """
-    Retrieve information about a specific song.
+    Retrieve information about a specific song, from the catalog cache when possible.
 
     Parameters:
-        db (database.db_dependency): The database dependency.
         songId (int): The unique identifier of the song.
+        if_none_match (str | None): The ETag of the response the client already has.
 
     Returns:
-        schemas.ShowSong: Details of the requested song.
+        schemas.ShowSong: Details of the requested song, or an empty 304 response if it hasn't changed.
 
     Raises:
         HTTPException: If the song with the specified ID is not found (HTTP 404).
     """
-    # Query the database to retrieve information about the song
-    song = db.query(models.Songs).filter(models.Songs.id == songId).first()
+    async def load(db):
+        # Query the database to retrieve information about the song
+        song = await load_song(db, songId)
 
-    # Check if the song exists
-    if not song:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song Not Found!")
+        # Check if the song exists
+        if not song:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song Not Found!")
+
+        return serialization.dump_json(schemas.ShowSong, song)
 
     # Return details of the requested song
-    return song
+    return await cache.catalog.fetch(cache.SONGS, songId, load, if_none_match)
+
+
+@router.get('/{songId}/stream')
+async def stream_song(
+    db: database.read_db_dependency,
+    songId: int,
+    range_header: Annotated[str | None, Header(alias="Range")] = None
+):
+
+    """
+    Stream the audio file of a song, with support for HTTP Range requests.
+
+    Parameters:
+        db (database.read_db_dependency): The database dependency.
+        songId (int): The unique identifier of the song.
+        range_header (str): The optional Range header, e.g. "bytes=0-1023".
+
+    Returns:
+        RangeFileResponse: The requested bytes of the audio file (HTTP 200 or 206).
+
+    Raises:
+        HTTPException: If the song or its audio file is not found (HTTP 404),
+                       if the requested range can't be satisfied (HTTP 416).
+    """
+
+    # Query the database to retrieve the song
+    song = await db.scalar(select(models.Songs).where(models.Songs.id == songId))
+
+    # Check if the song has a stored audio file
+    if not song or not song.fileName:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song Not Found!")
+
+    file_location = media.resolve(song.fileName)
+    if not os.path.isfile(file_location):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Audio File Not Found!")
+
+    # Send the requested bytes of the file
+    return media.RangeFileResponse(file_location, media_type=song.contentType, range_header=range_header)
+
+
+@router.get('/{songId}/waveform')
+async def get_waveform(db: database.read_db_dependency, songId: int, level: int = 1):
+
+    """
+    Get the precomputed waveform peaks of a song.
+
+    The body holds int8 (min, max) pairs, one per `X-Samples-Per-Peak` samples,
+    scaled to [-127, 127]. Level 0 is the most detailed.
+
+    Parameters:
+        db (database.read_db_dependency): The database dependency.
+        songId (int): The unique identifier of the song.
+        level (int): The zoom level of the peaks.
+
+    Returns:
+        Response: The binary peaks of the requested level.
+
+    Raises:
+        HTTPException: If the song has no peaks at this level (HTTP 404).
+    """
+
+    # Query the database for the peaks of the requested level
+    waveform = await db.scalar(
+        select(models.SongWaveform).where(
+            models.SongWaveform.songId == songId,
+            models.SongWaveform.level == level
+        )
+    )
+
+    if not waveform:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Waveform Not Found!")
+
+    return Response(
+        content=waveform.peaks,
+        media_type="application/octet-stream",
+        headers={
+            "X-Samples-Per-Peak": str(waveform.samplesPerPeak),
+            "X-Sample-Rate": str(waveform.sampleRate)
+        }
+    )
 
 
 @router.post('/upload', response_model=schemas.ShowSong)
 async def upload_songs(
-    db: database.db_dependency,
+    db: database.async_db_dependency,
+    es: database.es_dependency,
     songName: str,
     genreId: int,
     artistId: int,
     albumId: int,
     user: user_dep,
-    file: UploadFile
+    request: Request
 ):
     
     """
-    Upload a new song to the database.
+    Upload a new song to the database, sent as the raw request body.
+
+    The user and the song details are checked before the body is read, and
+    the file is written as it arrives, stopping as soon as it is too large.
 
     Parameters:
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
+        es (database.es_dependency): The Elasticsearch client.
         songName (str): The name of the song.
         genreId (int): The ID of the genre associated with the song.
         artistId (int): The ID of the artist associated with the song.
         albumId (int): The ID of the album associated with the song.
         user (user_dep): The current user's information.
-        file (UploadFile): The audio file to be uploaded.
+        request (Request): The request carrying the audio file, with an audio Content-Type.
 
     Returns:
         schemas.ShowSong: Details of the uploaded song.
@@ -65,79 +252,262 @@ async def upload_songs(
     Raises:
         HTTPException: If the user is not an admin (HTTP 401),
                        if the song with the specified name already exists (HTTP 302),
-                       if the specified album, artist, or genre is not found (HTTP 404).
+                       if the specified album, artist, or genre is not found (HTTP 404),
+                       if the file is not audio (HTTP 415) or too large (HTTP 413).
+    """
+
+    # Check the user, the song details and the announced file before any of it is read
+    await validate_new_song(db, user, songName, genreId, artistId, albumId)
+    content_type = request.headers.get("content-type")
+    content_length = request.headers.get("content-length")
+    media.check_audio(content_type, int(content_length) if content_length and content_length.isdigit() else None)
+
+    # Stream the file to disk as it arrives, hashing it on the way
+    file_location = media.temp_path()
+    size, digest = await media.save_upload(request.stream(), file_location)
+
+    # Store the content once, however many songs use it
+    file_name = await media.store_object(db, file_location, digest, size, content_type)
+
+    # Add the song to the database
+    db_song = models.Songs(
+        songName=songName,
+        genreId=genreId,
+        artistId=artistId,
+        albumId=albumId,
+        fileName=file_name,
+        contentType=content_type
+    )
+    db.add(db_song)
+    await db.commit()
+    await cache.catalog.invalidate(cache.ALBUMS, cache.ARTISTS)
+    db_song = await load_song(db, db_song.id)
+
+    # Index the song in Elasticsearch and read its audio details in the background
+    await index_song(es, db_song)
+    analysis.schedule(db_song.id, media.resolve(db_song.fileName))
+
+    # Return details of the uploaded song
+    return db_song
+
+
+@router.post('/upload/session', response_model=schemas.ShowUploadSession, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    db: database.async_db_dependency,
+    user: user_dep,
+    request: schemas.CreateUploadSession
+):
+
     """
+    Start a resumable upload of a large audio file.
 
-    # Generate a unique file ID for the uploaded song
-    file_id = uuid4()
+    Parameters:
+        db (database.async_db_dependency): The database dependency.
+        user (user_dep): The current user's information.
+        request (schemas.CreateUploadSession): The song details, content type and total size of the file.
 
-    # Read the file data
-    data = await file.read()
+    Returns:
+        schemas.ShowUploadSession: The upload session, expecting chunk 0.
 
-    # Create file name and location
-    file_name = f"{file_id}.{file.content_type.split('/')[1]}"
-    file_location = f"files/{file_name}"
+    Raises:
+        HTTPException: If the user is not an admin (HTTP 401),
+                       if the song with the specified name already exists (HTTP 302),
+                       if the specified album, artist, or genre is not found (HTTP 404),
+                       if the file is not audio (HTTP 415) or too large (HTTP 413).
+    """
 
-    # Write the file to the specified location
-    with open(file_location, 'wb+') as file_object:
-        file_object.write(data)
+    # Check the user, the song details and the announced file
+    await validate_new_song(db, user, request.songName, request.genreId, request.artistId, request.albumId)
+    media.check_declared_audio(request.contentType, request.totalSize)
+
+    # Create an empty file the chunks are appended to
+    session = models.UploadSession(
+        id=str(uuid4()),
+        userId=user['id'],
+        songName=request.songName,
+        genreId=request.genreId,
+        artistId=request.artistId,
+        albumId=request.albumId,
+        contentType=request.contentType,
+        totalSize=request.totalSize
+    )
+    await run_in_threadpool(media.create_partial, session.id)
 
-    file_object.close()
+    db.add(session)
+    await db.commit()
+    await db.refresh(session)
 
-    # Check if the user has admin privileges
-    if user['role'] != 1:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, 
-            detail="Only Admins can create a song!"
-        )
+    return session
 
-    # Check if the song with the specified name already exists
-    existing_song = db.query(models.Songs).filter(models.Songs.songName == songName).first()
-    if existing_song:
+
+@router.get('/upload/session/{sessionId}', response_model=schemas.ShowUploadSession)
+async def get_upload_session(db: database.async_db_dependency, user: user_dep, sessionId: str):
+
+    """
+    Get the received offset of a resumable upload.
+
+    Parameters:
+        db (database.async_db_dependency): The database dependency.
+        user (user_dep): The current user's information.
+        sessionId (str): The ID of the upload session.
+
+    Returns:
+        schemas.ShowUploadSession: The bytes received so far and the next expected chunk.
+
+    Raises:
+        HTTPException: If the upload session is not found (HTTP 404).
+    """
+
+    return await get_session(db, user, sessionId)
+
+
+@router.put('/upload/session/{sessionId}/{chunk}', response_model=schemas.ShowUploadSession)
+async def upload_chunk(
+    db: database.async_db_dependency,
+    user: user_dep,
+    sessionId: str,
+    chunk: int,
+    request: Request
+):
+
+    """
+    Append a numbered chunk, sent as the raw request body, to a resumable upload.
+
+    A chunk that was already received is acknowledged without being written
+    again, so clients can safely retry after a network failure.
+
+    Parameters:
+        db (database.async_db_dependency): The database dependency.
+        user (user_dep): The current user's information.
+        sessionId (str): The ID of the upload session.
+        chunk (int): The number of the chunk, starting at 0.
+        request (Request): The request carrying the chunk bytes.
+
+    Returns:
+        schemas.ShowUploadSession: The bytes received so far and the next expected chunk.
+
+    Raises:
+        HTTPException: If the upload session is not found (HTTP 404),
+                       if the chunk is ahead of the next expected chunk (HTTP 409),
+                       if the file grows past its announced size (HTTP 413).
+    """
+
+    session = await get_session(db, user, sessionId)
+
+    # Acknowledge retried chunks without writing them again
+    if chunk < session.nextChunk:
+        return session
+
+    if chunk > session.nextChunk:
         raise HTTPException(
-            status_code=status.HTTP_302_FOUND, 
-            detail="Song already exists!"
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Expected chunk {session.nextChunk}"
         )
 
-    # Query the database for album, artist, and genre
-    album = db.query(models.Album).filter(models.Album.id == albumId).first()
-    genre = db.query(models.Genre).filter(models.Genre.id == genreId).first()
-    artist = db.query(models.Artist).filter(models.Artist.id == artistId).first()
+    # Release the session while the chunk arrives, it is locked again only to append it
+    offset, total_size = session.receivedBytes, session.totalSize
+    await db.commit()
 
-    # Check if the specified album, artist, and genre exist
-    if not (album and genre and artist):
+    part = media.temp_path()
+    written = await media.save_chunk(request.stream(), part, offset=offset, max_size=total_size)
+
+    try:
+        session = await get_session(db, user, sessionId, lock=True)
+
+        # Another attempt at the same chunk got there first
+        if session.receivedBytes != offset or session.nextChunk != chunk:
+            if chunk < session.nextChunk:
+                await db.commit()
+                return session
+
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Expected chunk {session.nextChunk}"
+            )
+
+        # Append the chunk after the last acknowledged byte, dropping any partial write
+        await run_in_threadpool(media.append_chunk, part, media.partial_path(session.id), offset)
+
+        session.receivedBytes += written
+        session.nextChunk += 1
+        session.updatedAt = datetime.utcnow()
+        await db.commit()
+        await db.refresh(session)
+    finally:
+        await run_in_threadpool(os.remove, part)
+
+    return session
+
+
+@router.post('/upload/session/{sessionId}/finalize', response_model=schemas.ShowSong)
+async def finalize_upload(
+    db: database.async_db_dependency,
+    es: database.es_dependency,
+    user: user_dep,
+    sessionId: str
+):
+
+    """
+    Turn a completed resumable upload into a song.
+
+    Parameters:
+        db (database.async_db_dependency): The database dependency.
+        es (database.es_dependency): The Elasticsearch client.
+        user (user_dep): The current user's information.
+        sessionId (str): The ID of the upload session.
+
+    Returns:
+        schemas.ShowSong: Details of the uploaded song.
+
+    Raises:
+        HTTPException: If the upload session is not found (HTTP 404),
+                       if the file hasn't been fully received (HTTP 409),
+                       if the song can no longer be created (HTTP 302, 401, 404).
+    """
+
+    session = await get_session(db, user, sessionId, lock=True)
+
+    # Check that every byte has arrived
+    if session.receivedBytes != session.totalSize:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, 
-            detail="Please specify valid IDs for album, artist, and genre."
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Only {session.receivedBytes} of {session.totalSize} bytes received"
         )
 
-    # Add the song to the database
+    # The catalog may have changed since the session was created
+    await validate_new_song(db, user, session.songName, session.genreId, session.artistId, session.albumId)
+
+    # Move the assembled file into the content-addressed store
+    file_location = media.partial_path(session.id)
+    digest = await run_in_threadpool(media.hash_file, file_location)
+    file_name = await media.store_object(db, file_location, digest, session.totalSize, session.contentType)
+
+    # Add the song to the database and close the session
     db_song = models.Songs(
-        songName=songName,
-        genreId=genreId,
-        artistId=artistId,
-        albumId=albumId
+        songName=session.songName,
+        genreId=session.genreId,
+        artistId=session.artistId,
+        albumId=session.albumId,
+        fileName=file_name,
+        contentType=session.contentType
     )
     db.add(db_song)
-    db.commit()
-    db.refresh(db_song)
+    await db.delete(session)
+    await db.commit()
+    await cache.catalog.invalidate(cache.ALBUMS, cache.ARTISTS)
+    db_song = await load_song(db, db_song.id)
 
-    # Index the song in Elasticsearch
-    document = {
-        "songName": db_song.songName,
-        "artistName": db_song.artist.artistName,
-        "genreName": db_song.genre.genreName,
-        "albumName": db_song.album.albumName
-    }
-    es.index(index="songs", body=document)
+    # Index the song in Elasticsearch and read its audio details in the background
+    await index_song(es, db_song)
+    analysis.schedule(db_song.id, media.resolve(db_song.fileName))
 
-    # Return details of the uploaded song
     return db_song
 
 
 @router.put('/edit/{songId}')
-def edit_song(
-    db: database.db_dependency,
+async def edit_song(
+    db: database.async_db_dependency,
+    es: database.es_dependency,
     songId: int,
     req: schemas.EditSongRequest,
     user: user_dep
@@ -147,7 +517,8 @@ def edit_song(
     Edit details of an existing song.
 
     Parametrs:
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
+        es (database.es_dependency): The Elasticsearch client.
         songId (int): The ID of the song to be edited.
         req (schemas.EditSongRequest): The request body containing updated song details.
         user (user_dep): The current user's information.
@@ -155,6 +526,7 @@ def edit_song(
     Raises:
         HTTPException: If the user is not an admin (HTTP 401),
                        if the song with the specified ID is not found (HTTP 404),
+                       if another song with the specified name already exists (HTTP 302),
                        if the specified album, artist, or genre is not found (HTTP 404).
     """
 
@@ -166,7 +538,7 @@ def edit_song(
         )
 
     # Query the database for the existing song
-    song = db.query(models.Songs).filter(models.Songs.id == songId).first()
+    song = await db.scalar(select(models.Songs).where(models.Songs.id == songId))
 
     # Check if the song with the specified ID exists
     if not song:
@@ -175,10 +547,20 @@ def edit_song(
             detail="Song ID not found"
         )
 
+    # Check if another song with the specified name already exists
+    existing_song = await db.scalar(
+        select(models.Songs).where(models.Songs.songName == req.songName, models.Songs.id != songId)
+    )
+    if existing_song:
+        raise HTTPException(
+            status_code=status.HTTP_302_FOUND, 
+            detail="Song already exists!"
+        )
+
     # Query the database for the specified album, artist, and genre
-    album = db.query(models.Album).filter(models.Album.id == req.albumId).first()
-    genre = db.query(models.Genre).filter(models.Genre.id == req.genreId).first()
-    artist = db.query(models.Artist).filter(models.Artist.id == req.artistId).first()
+    album = await db.scalar(select(models.Album).where(models.Album.id == req.albumId))
+    genre = await db.scalar(select(models.Genre).where(models.Genre.id == req.genreId))
+    artist = await db.scalar(select(models.Artist).where(models.Artist.id == req.artistId))
 
     # Check if the specified album, artist, and genre exist
     if not (album and genre and artist):
@@ -192,10 +574,12 @@ def edit_song(
     song.albumId = req.albumId
     song.artistId = req.artistId
     song.genreId = req.genreId
+    await db.execute(loaders.touch_playlists(models.Songs.id == songId))
 
-    # Commit changes to the database
-    db.commit()
-    db.refresh(song)
+    # Commit changes to the database and drop the cached responses showing the song
+    await db.commit()
+    await cache.catalog.invalidate(cache.SONGS, cache.ALBUMS, cache.ARTISTS)
+    song = await load_song(db, song.id)
 
     # Update the indexed document in Elasticsearch
     document = {
@@ -204,15 +588,15 @@ def edit_song(
         "genreName": song.genre.genreName,
         "albumName": song.album.albumName
     }
-    es.update(index="songs", id=song.id, doc=document)
+    await database.es_call(es.update, index="songs", id=song.id, doc=document)
 
     # Return success message
     return { "detail" : "Song updated successfully!" }
 
 
 @router.delete('/delete/{songId}')
-def delete_song(
-    db: database.db_dependency,
+async def delete_song(
+    db: database.async_db_dependency,
     songId: int,
     user: user_dep
 ):
@@ -221,7 +605,7 @@ def delete_song(
     Delete a song by its ID.
 
     Parameters:
-        db (database.db_dependency): The database dependency.
+        db (database.async_db_dependency): The database dependency.
         songId (int): The ID of the song to be deleted.
         user (user_dep): The current user's information.
 
@@ -239,7 +623,7 @@ def delete_song(
         )
 
     # Query the database for the existing song
-    song = db.query(models.Songs).filter(models.Songs.id == songId).first()
+    song = await db.scalar(select(models.Songs).where(models.Songs.id == songId))
 
     # Check if the song with the specified ID exists
     if not song:
@@ -248,9 +632,15 @@ def delete_song(
             detail="Song ID not found"
         )
 
-    # Delete the song from the database
-    db.delete(song)
-    db.commit()
+    # Delete the song from the database along with its reference to the audio file
+    orphan = await media.release_object(db, song.fileName)
+    await db.execute(loaders.touch_playlists(models.Songs.id == songId))
+    await db.delete(song)
+    await db.commit()
+    await cache.catalog.invalidate(cache.SONGS, cache.ALBUMS, cache.ARTISTS)
+
+    # Remove the audio file once no song uses it any more
+    await media.remove_orphans(db, [orphan])
 
     # Return success message
     return { "detail" : "Song deleted successfully!" }
@@ -1,5 +1,8 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, ConfigDict
+from datetime import datetime
+from typing import Generic, List, TypeVar
+
+T = TypeVar("T")
 
 
 # Pydantic Models for Authentication
@@ -18,6 +21,12 @@ class CreateUser(BaseModel):
 
 
 # Below classes are defined for response model
+class Page(BaseModel, Generic[T]):
+    items : List[T]
+    nextCursor : int | None
+
+    model_config = ConfigDict(from_attributes=True)
+
 class createUserResponse(BaseModel):
     id : int
     username : str
@@ -27,75 +36,123 @@ class Artist(BaseModel):
     id : int
     artistName : str
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Genre(BaseModel):
     genreName : str
     id : int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Album(BaseModel):
     albumName : str
     id : int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class User(BaseModel):
     id : int
     username : str
 
+    model_config = ConfigDict(from_attributes=True)
+
 class ShowRatingInfo(BaseModel):
     rating : float
     byUserId : User
 
+class SongRatingSummary(BaseModel):
+    songId : int
+    rating : float
+    count : int
+    userRating : float | None
+
 class ShowSong(BaseModel):
     id : int
     songName : str
+    duration : float | None = None
+    sampleRate : int | None = None
+    bitrate : int | None = None
+    channels : int | None = None
     artist : Artist
     genre : Genre
-    album : Album
+    album : Album | None = None # None once its album is deleted
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class AlbumInfo(BaseModel):
     id : int
     albumName : str
-    songs : List[ShowSong]
+    songs : Page[ShowSong]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class PlaylistSongs(BaseModel):
     songs : ShowSong
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class ShowPlaylist(BaseModel):
+    id : int
+    playlistName : str
+    userId : int
+
+    model_config = ConfigDict(from_attributes=True)
 
 class ShowPlaylistInfo(BaseModel):
     id : int
     playlistName : str
     users : User
-    playlistSong : List[PlaylistSongs]
+    playlistSong : Page[PlaylistSongs]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ShowArtistDetails(BaseModel):
     id : int
     artistName : str
-    songs : List[ShowSong]
-    album : List[AlbumInfo]
+    songs : Page[ShowSong]
+    album : Page[Album]
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ShowUploadSession(BaseModel):
+    id : str
+    songName : str
+    totalSize : int
+    receivedBytes : int
+    nextChunk : int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class IngestJobCreated(BaseModel):
+    jobId : str
+    status : str
+
+class ShowIngestJob(BaseModel):
+    id : str
+    status : str
+    rowsProcessed : int
+    songsCreated : int
+    indexed : int
+    indexFailed : int
+    rowsPerSecond : float
+    errors : list
+    createdAt : datetime
+    startedAt : datetime | None
+    finishedAt : datetime | None
 
 
 # Below are Request Body Schemas
 class CreateByCondition(BaseModel):
     playlist : str
 
+class CreateUploadSession(BaseModel):
+    songName : str
+    genreId : int
+    artistId : int
+    albumId : int
+    contentType : str
+    totalSize : int
+
 class EditSongRequest(BaseModel):
     songName : str
     artistId : int
@@ -116,6 +173,14 @@ class PostRating(BaseModel):
     songId : int
     rating : float
 
+class ImportRating(BaseModel):
+    byUserId : int
+    songId : int
+    rating : float
+
+class BatchRating(BaseModel):
+    songIds : List[int]
+
 class PostAlbum(BaseModel):
     artistId : int
     albumName : str
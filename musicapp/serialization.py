@@ -0,0 +1,45 @@
+from functools import lru_cache
+from typing import Any
+
+from pydantic import TypeAdapter
+
+# Responses returned as a Response skip FastAPI's generic path, which validates
+# the return value against the response_model, dumps it to Python objects, walks
+# them again with jsonable_encoder and finally encodes them with json.dumps.
+
+
+@lru_cache(maxsize=None)
+def adapter(schema) -> TypeAdapter:
+
+    """
+    Get the compiled validator and serializer of a schema, built once per schema.
+
+    Parameters:
+        schema: A response schema, e.g. `schemas.ShowSong` or `schemas.Page[schemas.ShowSong]`.
+
+    Returns:
+        TypeAdapter: The adapter of the schema.
+    """
+
+    return TypeAdapter(schema)
+
+
+def dump_json(schema, value: Any) -> bytes:
+
+    """
+    Encode ORM rows, or dicts holding them, as the JSON of a schema.
+
+    The rows are read straight into the schema's compiled validator and the
+    result encoded by pydantic-core, without intermediate Python dicts.
+
+    Parameters:
+        schema: The response schema.
+        value (Any): The ORM rows or dicts to encode.
+
+    Returns:
+        bytes: The JSON document.
+    """
+
+    schema_adapter = adapter(schema)
+    return schema_adapter.dump_json(schema_adapter.validate_python(value, from_attributes=True))
+
@@ -0,0 +1,62 @@
+"""
+The catalog cache on the Redis backend, run against fakeredis: responses are
+loaded once, revalidated without a load, and invalidated in every worker
+sharing the backend.
+"""
+
+import asyncio
+
+from musicapp import cache
+
+
+def loader(body: bytes):
+
+    """
+    A load returning a fixed body, counting its calls.
+    """
+
+    calls = []
+
+    async def load(db):
+        calls.append(db)
+        return body
+
+    return load, calls
+
+
+def test_fetch_loads_once_and_revalidates():
+    async def run():
+        catalog = cache.CatalogCache(cache.create_backend("fakeredis://"), ttl=60)
+        load, calls = loader(b'{"id": 1}')
+
+        first = await catalog.fetch(cache.SONGS, "revalidate", load)
+        second = await catalog.fetch(cache.SONGS, "revalidate", load)
+        revalidated = await catalog.fetch(cache.SONGS, "revalidate", load, first.headers["ETag"])
+        await catalog.close()
+
+        return first, second, revalidated, calls
+
+    first, second, revalidated, calls = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert first.body == second.body == b'{"id": 1}'
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert revalidated.status_code == 304
+
+
+def test_invalidation_reaches_every_worker():
+    async def run():
+        # Two workers sharing one Redis
+        worker, other = (cache.CatalogCache(cache.create_backend("fakeredis://"), ttl=60) for _ in range(2))
+        load, calls = loader(b'{"id": 2}')
+
+        await worker.fetch(cache.ALBUMS, "shared", load)
+        await other.fetch(cache.ALBUMS, "shared", load)
+        await other.invalidate(cache.ALBUMS)
+        await worker.fetch(cache.ALBUMS, "shared", load)
+
+        await worker.close()
+        await other.close()
+        return calls
+
+    assert len(asyncio.run(run())) == 2
@@ -0,0 +1,104 @@
+"""
+The nested catalog responses, and the pages of their lists, load in a fixed
+number of SELECTs whatever the size of the catalog.
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+from musicapp import cache, database, models, pagination
+from musicapp.routes import album, artist, playlist, songs
+
+# Most SELECTs each response may take; an empty page takes one more to tell
+# an unknown album or artist from the end of the list
+CEILINGS = {
+    "song": 1,
+    "album": 2,
+    "album songs": 2,
+    "artist": 3,
+    "artist songs": 2,
+    "artist albums": 2,
+    "playlist": 2,
+    "playlist songs": 2
+}
+
+# The second page, which the keyset cursor seeks to without reading the first
+SECOND_PAGE = pagination.PageParams(after=1, limit=10)
+
+CALLS = {
+    "song": lambda db, ids: songs.show_song(ids["song"]),
+    "album": lambda db, ids: album.get_album(ids["album"]),
+    "album songs": lambda db, ids: album.get_album_songs(ids["album"], SECOND_PAGE),
+    "artist": lambda db, ids: artist.get_artist_info(ids["artist"]),
+    "artist songs": lambda db, ids: artist.get_artist_songs(ids["artist"], SECOND_PAGE),
+    "artist albums": lambda db, ids: artist.get_artist_albums(ids["artist"], SECOND_PAGE),
+    "playlist": lambda db, ids: playlist.show_all_songs(db, ids["playlist"], {"id": ids["user"]}),
+    "playlist songs": lambda db, ids: playlist.show_playlist_songs(db, ids["playlist"], {"id": ids["user"]}, SECOND_PAGE)
+}
+
+
+def seed(size: int) -> dict:
+    with database.SessionLocal() as db:
+        user = models.Users(username=f"user{size}", passwordHash="", role=1)
+        genre = models.Genre(genreName=f"genre{size}")
+        singer = models.Artist(artistName=f"artist{size}")
+        db.add_all([user, genre, singer])
+        db.flush()
+
+        records = [models.Album(albumName=f"album{size}-{n}", artistId=singer.id) for n in range(max(size // 10, 1))]
+        db.add_all(records)
+        db.flush()
+
+        tracks = [
+            models.Songs(songName=f"song{size}-{n}", genreId=genre.id, artistId=singer.id, albumId=records[n % len(records)].id)
+            for n in range(size)
+        ]
+        db.add_all(tracks)
+        db.flush()
+
+        mix = models.Playlist(playlistName=f"playlist{size}", userId=user.id)
+        db.add(mix)
+        db.flush()
+        db.add_all([models.PlaylistSong(playlistId=mix.id, songId=track.id) for track in tracks])
+        db.commit()
+
+        return {"user": user.id, "artist": singer.id, "album": records[0].id, "playlist": mix.id, "song": tracks[0].id}
+
+
+@pytest.fixture(scope="module")
+def catalogs() -> dict:
+    models.Base.metadata.create_all(database.engine)
+    return {size: seed(size) for size in (5, 200)}
+
+
+def count(call, ids: dict) -> int:
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    async def run():
+        # Load from the database, not from a response cached by an earlier test
+        await cache.catalog.invalidate(*cache.CATALOG)
+        async with database.AsyncSessionLocal() as db:
+            await call(db, ids)
+
+    # The routes serialise their responses, so any lazy load would be counted
+    event.listen(database.async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        asyncio.run(run())
+    finally:
+        event.remove(database.async_engine.sync_engine, "before_cursor_execute", record)
+
+    return len(statements)
+
+
+@pytest.mark.parametrize("name", CALLS)
+def test_queries_within_ceiling(catalogs, name):
+    small, large = (count(CALLS[name], ids) for ids in catalogs.values())
+
+    assert small <= CEILINGS[name]
+    assert large <= small
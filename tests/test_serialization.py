@@ -0,0 +1,67 @@
+"""
+The compiled serializers encode catalog responses exactly as FastAPI's generic path would.
+"""
+
+import asyncio
+import json
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from musicapp import models, schemas, serialization
+
+
+def build(size: int) -> dict:
+    owner = models.Users(id=1, username="owner", role=2, passwordHash="")
+    genre = models.Genre(id=1, genreName="genre")
+    singer = models.Artist(id=1, artistName="artist")
+    records = [models.Album(id=n, albumName=f"album{n}", artistId=1) for n in range(1, size // 10 + 2)]
+
+    tracks = []
+    for n in range(1, size + 1):
+        record = records[n % len(records)]
+        track = models.Songs(
+            id=n, songName=f"song{n}", duration=180.5, sampleRate=44100, bitrate=320000, channels=2,
+            artistId=1, genreId=1, albumId=record.id
+        )
+        # Set the relationships without back-populating the collections, as a joined load would
+        track.__dict__.update(artist=singer, genre=genre, album=record)
+        tracks.append(track)
+
+    entries = []
+    for n, track in enumerate(tracks, 1):
+        entry = models.PlaylistSong(id=n, playlistId=1, songId=track.id)
+        entry.__dict__["songs"] = track
+        entries.append(entry)
+
+    page = lambda items: {"items": items, "nextCursor": 42}
+    return {
+        "song": (schemas.ShowSong, tracks[0]),
+        "song page": (schemas.Page[schemas.ShowSong], page(tracks)),
+        "artist": (schemas.ShowArtistDetails, {
+            "id": singer.id, "artistName": singer.artistName, "songs": page(tracks), "album": page(records)
+        }),
+        "album": (schemas.AlbumInfo, {"id": 1, "albumName": "album", "songs": page(tracks)}),
+        "playlist": (schemas.ShowPlaylistInfo, {
+            "id": 1, "playlistName": "playlist", "users": owner, "playlistSong": page(entries)
+        })
+    }
+
+
+PAYLOADS = build(50)
+
+
+async def generic(schema, value) -> bytes:
+    # What a route returning ORM rows with a response_model goes through
+    field = create_response_field(name="Response", type_=schema)
+    content = await serialize_response(field=field, response_content=value, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+@pytest.mark.parametrize("name", PAYLOADS)
+def test_dump_json_matches_generic_path(name):
+    schema, value = PAYLOADS[name]
+
+    assert json.loads(serialization.dump_json(schema, value)) == json.loads(asyncio.run(generic(schema, value)))